@@ -0,0 +1,189 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import timeit
+
+import environment
+import evaluation
+import simple_crawler
+import training
+from util import Counter
+
+def bench_do_action():
+    robot_env = training.make_environment()
+    actions = [environment.ACTION_INDEX['hand-down'], environment.ACTION_INDEX['hand-up']]
+    i = 0
+    def run():
+        nonlocal i
+        i ^= 1
+        robot_env.do_action_id(actions[i])
+    return run
+
+def bench_move_arm():
+    robot = simple_crawler.CrawlerPhysics()
+    angles = [robot.min_arm_angle, robot.max_arm_angle]
+    i = 0
+    def run():
+        nonlocal i
+        i ^= 1
+        robot.move_arm(angles[i])
+    return run
+
+def bench_move_hand():
+    robot = simple_crawler.CrawlerPhysics()
+    angles = [robot.min_hand_angle, robot.max_hand_angle]
+    i = 0
+    def run():
+        nonlocal i
+        i ^= 1
+        robot.move_hand(angles[i])
+    return run
+
+def trained_agent():
+    robot_env = training.make_environment()
+    agent = training.make_agent(robot_env, epsilon=0.3, alpha=0.8, gamma=0.8, seed=0)
+    training.train(agent, robot_env, 1000)
+    agent.start_episode()
+    return robot_env, agent
+
+def bench_get_action():
+    robot_env, agent = trained_agent()
+    state = robot_env.get_current_state_id()
+    return lambda: agent.get_action(state)
+
+def bench_update():
+    robot_env, agent = trained_agent()
+    state = robot_env.get_current_state_id()
+    return lambda: agent.update(state, environment.ACTION_INDEX['hand-up'], state + 1, 1.0)
+
+def bench_evaluate():
+    robot_env, agent = trained_agent()
+    return lambda: evaluation.evaluate_agent(agent, robot_env)
+
+def bench_counter_getitem():
+    counter = Counter()
+    for arm in range(9):
+        for hand in range(13):
+            counter[((arm, hand), 'arm-up')] = 1.0
+    key = ((4, 6), 'arm-up')
+    return lambda: counter[key]
+
+def bench_counter_argmax():
+    counter = Counter()
+    for arm in range(9):
+        for hand in range(13):
+            counter[((arm, hand), 'arm-up')] = arm + hand / 13.0
+    key = ((4, 6), 'arm-up')
+    i = 0
+    def run():
+        nonlocal i
+        i ^= 1
+        counter[key] = i * 20.0
+        return counter.argMax()
+    return run
+
+def bench_step():
+    robot_env, agent = trained_agent()
+    return lambda: training.step(agent, robot_env)
+
+def bench_vec_step():
+    robot_env = training.make_environment()
+    vec_env = environment.VecEnvironment(robot_env, 1000)
+    up = [environment.ACTION_INDEX['hand-up']] * vec_env.n_crawlers
+    down = [environment.ACTION_INDEX['hand-down']] * vec_env.n_crawlers
+    def run():
+        vec_env.do_actions(up)
+        vec_env.do_actions(down)
+    return run
+
+# name: (setup returning the function to time, calls of the hot path per function call)
+BENCHMARKS = {
+    'environment.do_action': (bench_do_action, 1),
+    'crawler.move_arm': (bench_move_arm, 1),
+    'crawler.move_hand': (bench_move_hand, 1),
+    'agent.get_action': (bench_get_action, 1),
+    'agent.update': (bench_update, 1),
+    'evaluation.evaluate_agent': (bench_evaluate, 1),
+    'counter.getitem': (bench_counter_getitem, 1),
+    'counter.argmax': (bench_counter_argmax, 1),
+    'app.step': (bench_step, 1),
+    'vec_environment.do_actions': (bench_vec_step, 2000),
+}
+
+def run_benchmark(name, repeat=5, min_time=0.2):
+    """
+    Times one benchmark with timeit, calibrating the number of calls so every repetition
+    lasts at least min_time seconds. Reports the best and median time per hot path call.
+    """
+    setup, calls = BENCHMARKS[name]
+    timer = timeit.Timer(setup())
+    number, elapsed = timer.autorange()
+    number = max(number, int(number * min_time / elapsed) if elapsed else number)
+    times = [t / (number * calls) for t in timer.repeat(repeat, number)]
+    best = min(times)
+    return {
+        'name': name,
+        'ns_per_call': best * 1e9,
+        'median_ns_per_call': statistics.median(times) * 1e9,
+        'calls_per_sec': 1.0 / best,
+        'number': number * calls,
+        'repeat': repeat,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_all(names=None, repeat=5, min_time=0.2):
+    """
+    Runs the named benchmarks (all by default) and returns a JSON-serializable report.
+    """
+    return {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': [run_benchmark(name, repeat, min_time) for name in (names or BENCHMARKS)],
+    }
+
+def print_report(report, baseline=None):
+    """
+    Prints one line per benchmark, with the speedup over a baseline report if given.
+    """
+    previous = {r['name']: r for r in baseline['results']} if baseline else {}
+    for r in report['results']:
+        line = '%-28s %12.1f ns/call %14.0f calls/s' % (r['name'], r['ns_per_call'], r['calls_per_sec'])
+        if r['name'] in previous:
+            line += '  %.2fx' % (previous[r['name']]['ns_per_call'] / r['ns_per_call'])
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Micro-benchmarks of the step hot path')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default: %s' % ', '.join(BENCHMARKS))
+    parser.add_argument('--repeat', help='timed repetitions per benchmark, the best is reported', type=int, default=5)
+    parser.add_argument('--min-time', help='minimum seconds per repetition', type=float, default=0.2)
+    parser.add_argument('--output', help='write the report as JSON to this file', required=False)
+    parser.add_argument('--compare', help='JSON report of an earlier run to compare against', required=False)
+    args = parser.parse_args(argv)
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+    report = run_all(args.names, args.repeat, args.min_time)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,107 @@
+"""
+Saving and loading of Q-learning agents.
+
+A checkpoint file is the 8 byte magic b'SCQTABLE', a little-endian uint32 header length,
+a JSON header (state shape, action names, episode counters, epsilon/alpha/gamma and step count)
+padded with spaces to a multiple of 8 bytes, then the Q-values of the DenseQTable as
+little-endian doubles. Loading with mmap=True maps the values read-only instead of reading them.
+"""
+import json
+import mmap as mmap_module
+import os
+import struct
+import sys
+from array import array
+
+from q_table import DenseQTable
+
+MAGIC = b'SCQTABLE'
+LENGTH = struct.Struct('<I')
+
+def check_agent(agent):
+    """
+    Raises ValueError unless the agent learns into a DenseQTable, the only Q-values a checkpoint holds.
+    """
+    if not isinstance(getattr(agent, 'q_values', None), DenseQTable):
+        raise ValueError('Only agents with a DenseQTable can be checkpointed')
+
+def save_agent(agent, path, step_count=0):
+    """
+    Writes the agent's Q-table and parameters to path, replacing any existing file only
+    once the new one is complete.
+    """
+    check_agent(agent)
+    q_values = agent.q_values
+    header = {
+        'state_shape': list(q_values.state_shape),
+        'actions': list(q_values.actions),
+        'episodes_elapsed': agent.episodes_elapsed,
+        'num_training': agent.num_training,
+        'accum_train_rewards': agent.accum_train_rewards,
+        'accum_test_rewards': agent.accum_test_rewards,
+        'epsilon': agent.epsilon,
+        'alpha': agent.alpha,
+        'gamma': agent.discount,
+        'step_count': step_count,
+    }
+    text = json.dumps(header).encode('utf-8')
+    # pad so the values start 8-byte aligned and can be cast from a memory map
+    text += b' ' * (-(len(MAGIC) + LENGTH.size + len(text)) % 8)
+
+    values = array('d', q_values.values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(LENGTH.pack(len(text)))
+        f.write(text)
+        values.tofile(f)
+    os.replace(tmp_path, path)
+
+def read_checkpoint(path, mmap=False):
+    """
+    Returns the header dict and the Q-values of a checkpoint, as an array or, with mmap=True,
+    a read-only memoryview of the mapped file.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a Q-table checkpoint' % path)
+        length, = LENGTH.unpack(f.read(LENGTH.size))
+        header = json.loads(f.read(length).decode('utf-8'))
+        offset = len(MAGIC) + LENGTH.size + length
+
+        if mmap and sys.byteorder == 'little':
+            mapped = mmap_module.mmap(f.fileno(), 0, access=mmap_module.ACCESS_READ)
+            values = memoryview(mapped)[offset:].cast('d')
+        else:
+            values = array('d', f.read())
+            if sys.byteorder != 'little':
+                values.byteswap()
+    return header, values
+
+def load_agent(agent, path, mmap=False):
+    """
+    Restores a Q-learning agent from a checkpoint, replacing its Q-table, episode counters
+    and parameters. With mmap=True the Q-table is read-only, for evaluation.
+    Returns the checkpoint header.
+    """
+    check_agent(agent)
+    header, values = read_checkpoint(path, mmap)
+    q_values = DenseQTable(header['state_shape'], header['actions'], values=values)
+    current = getattr(agent, 'q_values', None)
+    if isinstance(current, DenseQTable) and \
+            (current.state_shape != q_values.state_shape or current.actions != q_values.actions):
+        raise ValueError('Checkpoint of shape %s does not match the Q-table of shape %s'
+                         % (q_values.state_shape, current.state_shape))
+
+    agent.q_values = q_values
+    agent.episodes_elapsed = header['episodes_elapsed']
+    agent.num_training = header['num_training']
+    agent.accum_train_rewards = header['accum_train_rewards']
+    agent.accum_test_rewards = header['accum_test_rewards']
+    agent.set_epsilon(header['epsilon'])
+    agent.set_learning_rate(header['alpha'])
+    agent.set_discount(header['gamma'])
+    return header
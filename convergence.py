@@ -0,0 +1,49 @@
+from array import array
+
+class ConvergenceMonitor:
+    """
+    Sliding window over the last window steps of an agent's learning: the absolute change of
+    the backed up Q-value and whether the greedy action of the state changed. Learning has
+    converged once the window is full, the mean Q-value change is at most q_tolerance and at
+    most a policy_tolerance fraction of the steps changed the greedy action. Recording a step
+    is O(1), the sums are updated as steps enter and leave the window.
+    """
+    def __init__(self, window=1000, q_tolerance=1e-3, policy_tolerance=0.0):
+        if window < 1:
+            raise ValueError('Convergence window must be at least 1 step')
+        self.window = window
+        self.q_tolerance = q_tolerance
+        self.policy_tolerance = policy_tolerance
+        self.q_changes = array('d', [0.0]) * window
+        self.policy_changes = bytearray(window)
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.q_change_sum = 0.0
+        self.policy_change_count = 0
+
+    def record(self, q_change, policy_changed):
+        head = self.head
+        if self.count == self.window:
+            self.q_change_sum -= self.q_changes[head]
+            self.policy_change_count -= self.policy_changes[head]
+        else:
+            self.count += 1
+        self.q_changes[head] = q_change
+        self.policy_changes[head] = policy_changed
+        self.q_change_sum += q_change
+        self.policy_change_count += policy_changed
+        self.head = 0 if head + 1 == self.window else head + 1
+
+    def mean_q_change(self):
+        # the running sum can drift slightly below 0 as values leave the window
+        return max(self.q_change_sum, 0.0) / self.count if self.count else 0.0
+
+    def policy_change_rate(self):
+        return self.policy_change_count / self.count if self.count else 0.0
+
+    def converged(self):
+        return self.count == self.window and self.mean_q_change() <= self.q_tolerance \
+            and self.policy_change_count <= self.policy_tolerance * self.window
@@ -1,14 +1,133 @@
-from simple_crawler import SimpleCrawler
+from array import array
+from functools import lru_cache
 
-class Environment:
+from simple_crawler import CrawlerPhysics
+
+ACTIONS = ('arm-down', 'arm-up', 'hand-down', 'hand-up')
+ACTION_INDEX = {a: i for i, a in enumerate(ACTIONS)}
+
+# (arm delta, hand delta) of each action, in the order of ACTIONS
+ACTION_MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+# environments with more (state, action) pairs than this compute each step from the crawler's
+# physics instead of keeping a transition table, which would take 12 bytes per pair
+TRANSITION_TABLE_LIMIT = 1 << 22
+
+class GridTable:
+    """
+    cell(arm, hand) of every state of the bucket grid, for cells that only depend on whether
+    each bucket is the first, the last or in between. Only those 9 cells are kept, so the table
+    takes the same memory at any resolution. It is indexed by state index like a list, or by
+    bucket numbers with get.
+    """
+    def __init__(self, n_arm_states, n_hand_states, cell):
+        self.n_hand_states = n_hand_states
+        self.n_states = n_arm_states * n_hand_states
+        self.last_arm = n_arm_states - 1
+        self.last_hand = n_hand_states - 1
+        self.cells = [cell(arm, hand) for arm in (0, 1, self.last_arm) for hand in (0, 1, self.last_hand)]
+
+    def get(self, arm, hand):
+        row = 0 if arm == 0 else 6 if arm == self.last_arm else 3
+        return self.cells[row + (0 if hand == 0 else 2 if hand == self.last_hand else 1)]
+
+    def __getitem__(self, state_index):
+        if not 0 <= state_index < self.n_states:
+            raise IndexError('state index %d out of range' % state_index)
+        return self.get(*divmod(state_index, self.n_hand_states))
+
+    def __len__(self):
+        return self.n_states
+
+    def to_list(self):
+        """
+        Returns a list of the cell of every state index, which is faster to index in loops.
+        Rows and cells that are alike share objects.
+        """
+        def row(cells):
+            return [cells[0]] + [cells[1]] * (self.last_hand - 1) + [cells[2]]
+        return row(self.cells[0:3]) + row(self.cells[3:6]) * (self.last_arm - 1) + row(self.cells[6:9])
+
+@lru_cache(maxsize=None)
+def get_legal_action_ids(n_arm_states, n_hand_states):
+    """
+    Returns the tuple of legal action indices of every state index of the bucket grid,
+    shared by every caller with the same grid.
+    """
+    return GridTable(n_arm_states, n_hand_states, lambda arm, hand: tuple(
+        action for action, (arm_delta, hand_delta) in enumerate(ACTION_MOVES)
+        if 0 <= arm + arm_delta < n_arm_states and 0 <= hand + hand_delta < n_hand_states))
+
+class TransitionTable:
+    """
+    Next state index and displacement of every (state, action) pair of a discretized crawler,
+    stored at index state index * len(ACTIONS) + action index, where the state index is
+    arm * n_hand_states + hand. Illegal actions have a next state index of -1.
+    The entries of a state are computed by fill the first time it is needed, so fine grids
+    only pay the trigonometry for the states they visit; fill_all completes the table.
+    """
+    def __init__(self, robot, arm_buckets, hand_buckets):
+        self.robot = robot
+        self.arm_buckets = list(arm_buckets)
+        self.hand_buckets = list(hand_buckets)
+        self.n_arm_states = len(arm_buckets)
+        self.n_hand_states = len(hand_buckets)
+        self.n_states = self.n_arm_states * self.n_hand_states
+        size = self.n_states * len(ACTIONS)
+
+        self.next_index = array('i', [-1]) * size
+        self.reward = array('d', [0.0]) * size
+        self.filled = bytearray(self.n_states)
+        # action indices of the legal actions, per state index, expanded as the table is per state anyway
+        self.legal_actions = get_legal_action_ids(self.n_arm_states, self.n_hand_states).to_list()
+
+    def fill(self, state_index):
+        arm, hand = divmod(state_index, self.n_hand_states)
+        arm_angle, hand_angle = self.arm_buckets[arm], self.hand_buckets[hand]
+        for action in self.legal_actions[state_index]:
+            arm_delta, hand_delta = ACTION_MOVES[action]
+            next_arm, next_hand = arm + arm_delta, hand + hand_delta
+            i = state_index * len(ACTIONS) + action
+            self.next_index[i] = next_arm * self.n_hand_states + next_hand
+            self.reward[i] = self.robot.get_displacement(arm_angle, hand_angle,
+                                                         self.arm_buckets[next_arm], self.hand_buckets[next_hand])
+        self.filled[state_index] = 1
 
-    def __init__(self, simple_robot: SimpleCrawler):
+    def fill_all(self):
+        filled = self.filled
+        for state_index in range(self.n_states):
+            if not filled[state_index]:
+                self.fill(state_index)
+        return self
+
+# tables are shared by every environment with the same robot geometry and buckets
+_transition_tables = {}
+
+def get_transition_table(robot, arm_buckets, hand_buckets):
+    key = (robot.get_geometry(), tuple(arm_buckets), tuple(hand_buckets))
+    table = _transition_tables.get(key)
+    if table is None:
+        table = _transition_tables[key] = TransitionTable(robot, arm_buckets, hand_buckets)
+    return table
+
+class Environment:
+    """
+    Discretizes the crawler's angles into buckets. States are (arm, hand) bucket numbers and
+    actions are the names in ACTIONS. The same steps can be taken with integer IDs instead:
+    state index arm * n_hand_states + hand, and the position of an action in ACTIONS.
+    Agents learn with the IDs, so names are only needed for display.
+    The number of buckets per angle sets the resolution of the state space.
+    """
+    def __init__(self, simple_robot: CrawlerPhysics, n_arm_states=9, n_hand_states=13):
         self.robot = simple_robot
         # state: (arm_angle, hand_angle) in bucket numbers, not degree measurements
         self.state = None
+        self.state_id = None
 
-        self.n_arm_states = 9
-        self.n_hand_states = 13
+        if n_arm_states < 2 or n_hand_states < 2:
+            raise ValueError('Environment needs at least 2 buckets per angle')
+        self.n_arm_states = n_arm_states
+        self.n_hand_states = n_hand_states
 
         min_arm_angle, max_arm_angle = self.robot.get_arm_minmax_angle()
         min_hand_angle, max_hand_angle = self.robot.get_hand_minmax_angle()
@@ -18,54 +137,180 @@ class Environment:
         self.arm_buckets = [min_arm_angle + (arm_inc * i) for i in range(self.n_arm_states)]
         self.hand_buckets = [min_hand_angle + (hand_inc * i) for i in range(self.n_hand_states)]
 
+        # legal actions of each state index, as IDs and as names
+        self.legal_action_ids = get_legal_action_ids(self.n_arm_states, self.n_hand_states)
+        self.legal_actions = GridTable(self.n_arm_states, self.n_hand_states, lambda arm, hand: tuple(
+            ACTIONS[a] for a in self.legal_action_ids.get(arm, hand)))
+
+        # built on the first step, see get_transitions
+        self.transitions = None
+        self.use_transitions = self.n_arm_states * self.n_hand_states * len(ACTIONS) <= TRANSITION_TABLE_LIMIT
+
         self.reset()
 
+    def get_state_shape(self):
+        return self.n_arm_states, self.n_hand_states
+
+    def get_all_actions(self):
+        return ACTIONS
+
+    def get_transitions(self):
+        if self.transitions is None:
+            self.transitions = get_transition_table(self.robot, self.arm_buckets, self.hand_buckets)
+        return self.transitions
+
+    def get_state_index(self, state):
+        return state[0] * self.n_hand_states + state[1]
+
+    def get_state(self, state_index):
+        return divmod(state_index, self.n_hand_states)
+
+    def get_state_angles(self, state_id):
+        """
+        Returns the (arm, hand) angles of the crawler in a state given by index, as get_angles
+        does after reaching it.
+        """
+        arm, hand = divmod(state_id, self.n_hand_states)
+        return self.arm_buckets[arm], self.hand_buckets[hand]
+
+    def get_action_id(self, action):
+        return ACTION_INDEX[action]
+
+    def get_action_name(self, action_id):
+        return ACTIONS[action_id]
+
     def get_current_state(self):
         return self.state
-    
+
+    def get_current_state_id(self):
+        return self.state_id
+
     def get_possible_actions(self, state):
-        actions = list()
-        current_arm, current_hand = state
-        if current_arm > 0: actions.append('arm-down')
-        if current_arm < self.n_arm_states - 1: actions.append('arm-up')
-        if current_hand > 0: actions.append('hand-down')
-        if current_hand < self.n_hand_states - 1: actions.append('hand-up')
-        return actions
-    
-    def do_action(self, action):
-        next_state, reward = None, None
-
-        oldX, oldY = self.robot.get_position()
-
-        arm, hand = self.state
-        
-        if action == 'arm-down':
-            new_arm = self.arm_buckets[arm - 1]
-            self.robot.move_arm(new_arm)
-            next_state = (arm - 1, hand)
-        if action == 'arm-up':
-            new_arm = self.arm_buckets[arm + 1]
-            self.robot.move_arm(new_arm)
-            next_state = (arm + 1, hand)
-        
-        if action == 'hand-down':
-            new_hand = self.hand_buckets[hand - 1]
-            self.robot.move_hand(new_hand)
-            next_state = (arm, hand - 1)
-        if action == 'hand-up':
-            new_hand = self.hand_buckets[hand + 1]
-            self.robot.move_hand(new_hand)
-            next_state = (arm, hand + 1)
-
-        newX, newY = self.robot.get_position()
-        reward = newX - oldX
+        """
+        Returns the names of the legal actions in a state, as a shared tuple.
+        """
+        return self.legal_actions.get(state[0], state[1])
+
+    def get_possible_action_ids(self, state_id):
+        return self.legal_action_ids[state_id]
+
+    def do_action_id(self, action_id):
+        """
+        Performs an action given by ID, returns the next state index and the reward.
+        """
+        if not self.use_transitions:
+            return self.move_robot(action_id)
+
+        transitions = self.get_transitions()
+        if not transitions.filled[self.state_id]:
+            transitions.fill(self.state_id)
+        i = self.state_id * len(ACTIONS) + action_id
+        next_id = transitions.next_index[i]
+        if next_id < 0:
+            raise Exception('Crawling Robot: %s is not possible in state %s' % (ACTIONS[action_id], self.state))
+
+        next_state = divmod(next_id, self.n_hand_states)
+        oldX = self.robot.position[0]
+        self.robot.move_to(self.arm_buckets[next_state[0]], self.hand_buckets[next_state[1]], transitions.reward[i])
+        reward = self.robot.position[0] - oldX
+
+        self.state = next_state
+        self.state_id = next_id
+        return next_id, reward
+
+    def get_transition(self, state_id, action_id):
+        """
+        Returns the next state index and the displacement of an action given by ID from any state,
+        without moving the crawler.
+        """
+        if action_id not in self.legal_action_ids[state_id]:
+            raise Exception('Crawling Robot: %s is not possible in state %s' % (ACTIONS[action_id], self.get_state(state_id)))
+        if self.use_transitions:
+            transitions = self.get_transitions()
+            if not transitions.filled[state_id]:
+                transitions.fill(state_id)
+            i = state_id * len(ACTIONS) + action_id
+            return transitions.next_index[i], transitions.reward[i]
+        arm, hand = divmod(state_id, self.n_hand_states)
+        arm_delta, hand_delta = ACTION_MOVES[action_id]
+        next_arm, next_hand = arm + arm_delta, hand + hand_delta
+        displacement = self.robot.get_displacement(self.arm_buckets[arm], self.hand_buckets[hand],
+                                                   self.arm_buckets[next_arm], self.hand_buckets[next_hand])
+        return next_arm * self.n_hand_states + next_hand, displacement
+
+    def move_robot(self, action_id):
+        """
+        Performs an action given by ID through the crawler's physics, without the transition table.
+        """
+        if action_id not in self.legal_action_ids[self.state_id]:
+            raise Exception('Crawling Robot: %s is not possible in state %s' % (ACTIONS[action_id], self.state))
+        arm_delta, hand_delta = ACTION_MOVES[action_id]
+        next_state = (self.state[0] + arm_delta, self.state[1] + hand_delta)
+
+        oldX = self.robot.position[0]
+        if arm_delta:
+            self.robot.move_arm(self.arm_buckets[next_state[0]])
+        else:
+            self.robot.move_hand(self.hand_buckets[next_state[1]])
+        reward = self.robot.position[0] - oldX
 
         self.state = next_state
-        return next_state, reward
-    
+        self.state_id = self.get_state_index(next_state)
+        return self.state_id, reward
+
+    def do_action(self, action):
+        next_id, reward = self.do_action_id(ACTION_INDEX[action])
+        return self.state, reward
+
+    def get_start_state(self):
+        return (self.n_arm_states // 2, self.n_hand_states // 2)
+
     def reset(self):
-        arm_state = self.n_arm_states // 2
-        hand_state = self.n_hand_states // 2
+        arm_state, hand_state = self.get_start_state()
         self.state = (arm_state, hand_state)
+        self.state_id = self.get_state_index(self.state)
         self.robot.set_angles(self.arm_buckets[arm_state], self.hand_buckets[hand_state])
-        self.robot.positions = [20, self.robot.get_position()[0]]
+        self.robot.positions.reset(20, self.robot.get_position()[0])
+
+
+class VecEnvironment:
+    """
+    Many independent crawlers on the bucket grid of an Environment, advanced together.
+    States and actions are indices (see Environment.get_state_index and ACTIONS) held in
+    arrays, and each step looks up every crawler's move in the shared transition table,
+    which is completed up front.
+    """
+    def __init__(self, robot_env: Environment, n_crawlers):
+        self.n_crawlers = n_crawlers
+        self.transitions = robot_env.get_transitions().fill_all()
+        self.n_actions = len(ACTIONS)
+        self.start_state = robot_env.get_state_index((robot_env.n_arm_states // 2, robot_env.n_hand_states // 2))
+        self.start_position = 20
+        self.reset()
+
+    def reset(self):
+        self.states = array('l', [self.start_state]) * self.n_crawlers
+        self.positions = array('d', [self.start_position]) * self.n_crawlers
+
+    def get_possible_actions(self, state_index):
+        return self.transitions.legal_actions[state_index]
+
+    def do_actions(self, actions):
+        """
+        Applies one action index per crawler.
+        Returns arrays of the next state indices and rewards.
+        """
+        n_actions = self.n_actions
+        next_index = self.transitions.next_index
+        reward = self.transitions.reward
+
+        indices = [s * n_actions + a for s, a in zip(self.states, actions)]
+        next_states = array('l', [next_index[i] for i in indices])
+        if min(next_states) < 0:
+            k = next_states.index(-1)
+            raise Exception('Crawling Robot: action %d is not possible in state %d' % (actions[k], self.states[k]))
+        rewards = array('d', [reward[i] for i in indices])
+
+        self.positions = array('d', [p + r for p, r in zip(self.positions, rewards)])
+        self.states = next_states
+        return next_states, rewards
@@ -0,0 +1,43 @@
+from collections import namedtuple
+
+from environment import ACTIONS
+
+# result of evaluate_policy: steps before the policy enters its cycle and the displacement over
+# them, then the (state, action name) pairs of one cycle, its length, displacement and velocity per step;
+# a policy that reaches a state without an action ends with an empty cycle of velocity 0
+PolicyEvaluation = namedtuple('PolicyEvaluation', ['transient_steps', 'transient_displacement', 'cycle',
+                                                   'cycle_steps', 'cycle_displacement', 'velocity'])
+
+def evaluate_policy(robot_env, policy, state=None):
+    """
+    Follows a deterministic policy, a function from state index to action index such as
+    QLearningAgent.get_policy, on the environment's model from state (the start state by default)
+    without moving the crawler. Since the environment is deterministic, the rollout repeats as soon
+    as it revisits a state, so the gait it settles into is found within as many steps as there are
+    states and its velocity is exact, not an average over a window.
+    """
+    state_id = robot_env.get_state_index(state if state is not None else robot_env.get_start_state())
+    # step at which each state was visited, and the displacement before each step
+    visited = {}
+    pairs = []
+    distances = [0.0]
+    while state_id not in visited:
+        visited[state_id] = len(pairs)
+        action = policy(state_id)
+        if action is None:
+            return PolicyEvaluation(len(pairs), distances[-1], (), 0, 0.0, 0.0)
+        pairs.append((robot_env.get_state(state_id), ACTIONS[action]))
+        state_id, displacement = robot_env.get_transition(state_id, action)
+        distances.append(distances[-1] + displacement)
+
+    start = visited[state_id]
+    cycle_steps = len(pairs) - start
+    cycle_displacement = distances[-1] - distances[start]
+    return PolicyEvaluation(start, distances[start], tuple(pairs[start:]), cycle_steps,
+                            cycle_displacement, cycle_displacement / cycle_steps)
+
+def evaluate_agent(agent, robot_env, state=None):
+    """
+    Evaluates the greedy policy of an agent, see evaluate_policy.
+    """
+    return evaluate_policy(robot_env, agent.get_policy, state)
@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import training
+from q_table import DenseQTable
+
+FIELDS = ['worker', 'seed', 'avg_velocity', 'threshold_step', 'converged_step', 'wall_time']
+
+class SharedQTable:
+    """
+    Q-values of a DenseQTable layout in a named block of shared memory. The process that
+    creates it (name=None) owns the block and removes it on close; other processes attach
+    to it by name. table returns a DenseQTable over the shared values, read-only if asked.
+    """
+    def __init__(self, state_shape, actions, name=None):
+        self.state_shape = tuple(state_shape)
+        self.actions = tuple(actions)
+        size = len(self.actions)
+        for n in self.state_shape:
+            size *= n
+        self.owner = name is None
+        if self.owner:
+            # new blocks are zero-filled, the default Q-value
+            self.memory = SharedMemory(create=True, size=size * 8)
+        else:
+            self.memory = SharedMemory(name)
+        self.name = self.memory.name
+        self.values = self.memory.buf[:size * 8].cast('d')
+        self.views = []
+
+    def table(self, readonly=False):
+        values = self.values
+        if readonly:
+            values = values.toreadonly()
+            self.views.append(values)
+        return DenseQTable(self.state_shape, self.actions, values=values)
+
+    def close(self):
+        """
+        Releases the shared values, so tables returned by table can no longer be used.
+        """
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+        self.values.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def run_worker(params):
+    """
+    Trains one agent on the shared table named in params, a dict of name, state_shape, actions,
+    worker, agent (see training.LEARNING_AGENTS), agent_kwargs, arm_states, hand_states, epsilon,
+    alpha, gamma, seed, steps and velocity_threshold. Returns a row of the results table.
+    """
+    shared = SharedQTable(params['state_shape'], params['actions'], params['name'])
+    try:
+        robot_env = training.make_environment(params['arm_states'], params['hand_states'])
+        agent = training.make_agent(robot_env, params['agent'], q_values=shared.table(), epsilon=params['epsilon'],
+                                    alpha=params['alpha'], gamma=params['gamma'], seed=params['seed'],
+                                    **params['agent_kwargs'])
+        result = training.train(agent, robot_env, params['steps'], velocity_threshold=params['velocity_threshold'])
+    finally:
+        shared.close()
+    row = {'worker': params['worker'], 'seed': params['seed']}
+    row.update(result)
+    return row
+
+def train_hogwild(shared, workers, steps, agent='qlearning', agent_kwargs=None, epsilon=0.5, alpha=0.8, gamma=0.8,
+                  seed=0, arm_states=9, hand_states=13, velocity_threshold=None):
+    """
+    Trains workers processes at once, each with its own crawler and an agent seeded seed + worker,
+    for steps steps. All of them back up into the SharedQTable without locks (Hogwild): a write
+    racing with another may be lost, which Q-learning tolerates since every pair is backed up
+    again. The table's shape must match arm_states and hand_states.
+    Returns a row per worker, see FIELDS.
+    """
+    if agent not in training.LEARNING_AGENTS:
+        raise ValueError('Hogwild training needs a tabular learning agent, not %s' % agent)
+    if shared.state_shape != (arm_states, hand_states):
+        raise ValueError('Shared Q-table of shape %s does not match %d arm and %d hand states'
+                         % (shared.state_shape, arm_states, hand_states))
+    trials = [{'name': shared.name, 'state_shape': shared.state_shape, 'actions': shared.actions,
+               'worker': worker, 'agent': agent, 'agent_kwargs': agent_kwargs or {},
+               'arm_states': arm_states, 'hand_states': hand_states,
+               'epsilon': epsilon, 'alpha': alpha, 'gamma': gamma, 'seed': seed + worker,
+               'steps': steps, 'velocity_threshold': velocity_threshold}
+              for worker in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_worker, trials))
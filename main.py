@@ -1,38 +1,321 @@
 import argparse
+import sys
 
-from visuals import run
+import training
 
-if __name__ == '__main__':
-    parse = True
-    if parse:
-        parser = argparse.ArgumentParser()
-        parser.add_argument('--epsilon', help='change the initial epsilon (explore/exploit probability) value, must be in between 0-1, may result in slight deviation from the inputted value', required=False)
-        parser.add_argument('--alpha', help='change the initial alpha (learning rate) value, must be between 0-1, may result in slight deviation from the inputted value', required=False)
-        parser.add_argument('--gamma', help='change the initial gamma (discount rate) value, must be between 0-1, may result in slight deviation from the inputted value', required=False)
-
-        args = parser.parse_args()
-
-        kwargs = {}
-        if args.alpha:
-            alpha = float(args.alpha)
-            if alpha < 0.0 or alpha > 1.0:
-                raise ValueError('Argument alpha invalid')
-            kwargs['alpha'] = alpha
-        if args.epsilon:
-            epsilon = float(args.epsilon)
-            if epsilon < 0.0 or epsilon > 1.0:
-                raise ValueError('Argument epsilon invalid')
-            kwargs['epsilon'] = epsilon
-        if args.gamma:
-            gamma = float(args.gamma)
-            if gamma < 0.0 or gamma > 1.0:
-                raise ValueError('Argument gamma invalid')
-            kwargs['gamma'] = gamma
-        
-        # if not kwargs:
-        #     run()
-        # else:
+# modules beyond training are imported by the commands that use them, so only gui loads tkinter
+COMMANDS = ('train', 'eval', 'bench', 'gui')
+
+def add_agent_arguments(parser):
+    parser.add_argument('--epsilon', help='change the initial epsilon (explore/exploit probability) value, must be in between 0-1, may result in slight deviation from the inputted value', required=False)
+    parser.add_argument('--alpha', help='change the initial alpha (learning rate) value, must be between 0-1, may result in slight deviation from the inputted value', required=False)
+    parser.add_argument('--gamma', help='change the initial gamma (discount rate) value, must be between 0-1, may result in slight deviation from the inputted value', required=False)
+    parser.add_argument('--agent', help='qlearning (default), qlambda (Watkins Q(lambda)), nstep (n-step Q-learning), dyna (Dyna-Q with prioritized sweeping) replay (Q-learning from experience replay) and linear (Q-learning over tile-coded angles) learn by crawling, value-iteration plans the optimal policy from the environment model', choices=training.AGENTS, default='qlearning')
+    parser.add_argument('--arm-states', help='buckets the arm angle is divided into, 9 by default', type=int, default=9)
+    parser.add_argument('--hand-states', help='buckets the hand angle is divided into, 13 by default', type=int, default=13)
+    parser.add_argument('--seed', help='seed of the agent\'s random numbers so runs repeat, random by default; sweeps seed runs from it', type=int, required=False)
+    parser.add_argument('--trace-decay', help='lambda of the qlambda agent, between 0-1', type=float, default=0.9)
+    parser.add_argument('--n-steps', help='steps per backup of the nstep agent', type=int, default=4)
+    parser.add_argument('--planning-steps', help='simulated backups per real step of the dyna agent', type=int, default=10)
+    parser.add_argument('--batch-size', help='transitions backed up per step by the replay agent', type=int, default=32)
+    parser.add_argument('--buffer-size', help='transitions kept by the replay agent', type=int, default=10000)
+    parser.add_argument('--prioritized', help='sample transitions of the replay agent by their Bellman error', action='store_true')
+    parser.add_argument('--tiles', help='tiles per angle in each tiling of the linear agent', type=int, default=8)
+    parser.add_argument('--tilings', help='offset tilings of the linear agent', type=int, default=8)
+
+def add_training_arguments(parser):
+    parser.add_argument('--steps', help='training steps per run', type=int, default=10000)
+    parser.add_argument('--threshold', help='average velocity whose first step is reported', type=float, default=1.5)
+    parser.add_argument('--sweep', help='train headless agents for every combination of --epsilons, --alphas and --gammas', action='store_true')
+    parser.add_argument('--epsilons', help='sweep epsilon values, comma separated (0.1,0.5) or start:stop:count (0.1:0.9:5)', default='0.5')
+    parser.add_argument('--alphas', help='sweep alpha values, same format as --epsilons', default='0.8')
+    parser.add_argument('--gammas', help='sweep gamma values, same format as --epsilons', default='0.8')
+    parser.add_argument('--seeds', help='sweep runs per parameter combination, seeded --seed (0 by default) to --seed + seeds - 1', type=int, default=1)
+    parser.add_argument('--workers', help='sweep worker processes, defaults to the number of cores', type=int, required=False)
+    parser.add_argument('--output', help='results CSV file, printed if not given', required=False)
+    parser.add_argument('--hogwild', help='train this many worker processes on one shared Q-table for --steps steps each', type=int, required=False)
+    parser.add_argument('--converge-window', help='stop a run before --steps once the Q-values and greedy policy have settled over this many steps, 0 (never) by default', type=int, default=0)
+    parser.add_argument('--q-tolerance', help='mean absolute Q-value change per step over --converge-window below which the Q-values have settled', type=float, default=1e-3)
+    parser.add_argument('--policy-tolerance', help='fraction of the steps in --converge-window that may change the greedy action once the policy has settled', type=float, default=0.0)
+
+def add_gui_arguments(parser):
+    add_agent_arguments(parser)
+    parser.add_argument('--load', help='restore the Q-learning agent from a checkpoint file', required=False)
+    parser.add_argument('--save', help='save the Q-learning agent to a checkpoint file periodically and on exit', required=False)
+    parser.add_argument('--checkpoint-every', help='steps between automatic checkpoints when --save is given, which are at least 10 seconds apart', type=int, default=10000)
+    parser.add_argument('--turbo', help='start in turbo mode, training at CPU speed while the window refreshes at a fixed rate', action='store_true')
+    parser.add_argument('--fps', help='maximum frames drawn per second, 30 by default', type=float, required=False)
+    parser.add_argument('--velocity-window', help='steps covered by the average velocity readout, 100 by default', type=int, required=False)
+    parser.add_argument('--metrics', help='time each phase of the training loop (action, environment, update, sleep, render)', action='store_true')
+    parser.add_argument('--metrics-file', help='append training loop metrics to this file as JSON lines every second, implies --metrics', required=False)
+    # --sweep trains headless instead of opening the window, and with --hogwild the window
+    # follows the greedy policy of the shared table
+    add_training_arguments(parser)
+
+def make_parser():
+    parser = argparse.ArgumentParser(description='Simple crawler learning to crawl with reinforcement learning. '
+                                                 'Without a command the window is opened, as with gui.')
+    commands = parser.add_subparsers(dest='command')
+
+    train = commands.add_parser('train', help='train headless agents and print their results as CSV')
+    add_agent_arguments(train)
+    add_training_arguments(train)
+    train.add_argument('--load', help='resume training from a checkpoint file', required=False)
+    train.add_argument('--save', help='save the trained Q-learning agent, or the Hogwild table, to a checkpoint file', required=False)
+
+    evaluate = commands.add_parser('eval', help='print the gait and exact velocity of a greedy policy')
+    add_agent_arguments(evaluate)
+    evaluate.add_argument('--load', help='checkpoint whose greedy policy is evaluated, required unless --agent is value-iteration', required=False)
+
+    # listed for --help only, main passes the arguments after bench to benchmark.py as they are
+    commands.add_parser('bench', help='time the step hot path, see benchmark.py --help', add_help=False)
+
+    gui = commands.add_parser('gui', help='open the window and train the crawler (default)')
+    add_gui_arguments(gui)
+    return parser
+
+def agent_options(args):
+    """
+    Checks the agent arguments. Returns the keyword arguments of visuals.App, with the parameters
+    only if they were given, and the agent-specific ones among them.
+    """
+    kwargs = {}
+    if args.alpha:
+        alpha = float(args.alpha)
+        if alpha < 0.0 or alpha > 1.0:
+            raise ValueError('Argument alpha invalid')
+        kwargs['alpha'] = alpha
+    if args.epsilon:
+        epsilon = float(args.epsilon)
+        if epsilon < 0.0 or epsilon > 1.0:
+            raise ValueError('Argument epsilon invalid')
+        kwargs['epsilon'] = epsilon
+    if args.gamma:
+        gamma = float(args.gamma)
+        if gamma < 0.0 or gamma > 1.0:
+            raise ValueError('Argument gamma invalid')
+        kwargs['gamma'] = gamma
+    kwargs['agent'] = args.agent
+    if args.arm_states < 2 or args.hand_states < 2:
+        raise ValueError('Argument arm-states or hand-states invalid')
+    kwargs['arm_states'] = args.arm_states
+    kwargs['hand_states'] = args.hand_states
+    # replay backs up batches in a dense table, and the model of dyna keeps every visited pair,
+    # so neither fits the bounded sparse table of larger grids
+    if args.agent in ('replay', 'dyna') and not training.has_dense_table(args.agent, (args.arm_states, args.hand_states)):
+        raise ValueError('Argument agent invalid: %s needs a dense Q-table, too large for %d arm and %d hand states'
+                         % (args.agent, args.arm_states, args.hand_states))
+    # only Q-learning agents with a dense table can be checkpointed, see checkpoint.check_agent
+    if (getattr(args, 'save', None) or args.load) \
+            and not training.has_dense_table(args.agent, (args.arm_states, args.hand_states)):
+        raise ValueError('Argument save or load invalid for the %s agent with %d arm and %d hand states'
+                         % (args.agent, args.arm_states, args.hand_states))
+    if args.seed is not None:
+        kwargs['seed'] = args.seed
+    agent_kwargs = {}
+    if args.agent == 'qlambda':
+        if args.trace_decay < 0.0 or args.trace_decay > 1.0:
+            raise ValueError('Argument trace-decay invalid')
+        agent_kwargs['trace_decay'] = args.trace_decay
+    if args.agent == 'nstep':
+        if args.n_steps < 1:
+            raise ValueError('Argument n-steps invalid')
+        agent_kwargs['n_steps'] = args.n_steps
+    if args.agent == 'dyna':
+        if args.planning_steps < 0:
+            raise ValueError('Argument planning-steps invalid')
+        agent_kwargs['planning_steps'] = args.planning_steps
+    if args.agent == 'replay':
+        if args.batch_size < 1:
+            raise ValueError('Argument batch-size invalid')
+        if args.buffer_size < 1:
+            raise ValueError('Argument buffer-size invalid')
+        agent_kwargs['batch_size'] = args.batch_size
+        agent_kwargs['buffer_size'] = args.buffer_size
+        agent_kwargs['prioritized'] = args.prioritized
+    if args.agent == 'linear':
+        if args.tiles < 1 or args.tilings < 1:
+            raise ValueError('Argument tiles or tilings invalid')
+        agent_kwargs['n_tiles'] = args.tiles
+        agent_kwargs['n_tilings'] = args.tilings
+    kwargs.update(agent_kwargs)
+    return kwargs, agent_kwargs
+
+def convergence_options(args):
+    """
+    Checks the convergence arguments. Returns the agent keyword arguments that make runs stop
+    once learning has converged, none if no window was given.
+    """
+    if args.converge_window < 0:
+        raise ValueError('Argument converge-window invalid')
+    if args.q_tolerance < 0.0:
+        raise ValueError('Argument q-tolerance invalid')
+    if args.policy_tolerance < 0.0 or args.policy_tolerance > 1.0:
+        raise ValueError('Argument policy-tolerance invalid')
+    if not args.converge_window:
+        return {}
+    return {'convergence_window': args.converge_window, 'q_tolerance': args.q_tolerance,
+            'policy_tolerance': args.policy_tolerance}
+
+def start_hogwild(args, kwargs, agent_kwargs):
+    """
+    Creates the shared Q-table and trains it on a background thread, which prints the results.
+    Returns the table and the thread.
+    """
+    import threading
+
+    import environment
+    import hogwild
+    import sweep
+
+    if args.hogwild < 1:
+        raise ValueError('Argument hogwild invalid')
+    if args.agent not in training.LEARNING_AGENTS:
+        raise ValueError('Argument agent invalid for hogwild training')
+    if args.load:
+        raise ValueError('Argument load invalid for hogwild training')
+    shared = hogwild.SharedQTable((args.arm_states, args.hand_states), environment.ACTIONS)
+    trainer = threading.Thread(target=lambda: sweep.write_results(hogwild.train_hogwild(
+        shared, args.hogwild, args.steps, agent=args.agent, agent_kwargs=agent_kwargs,
+        epsilon=kwargs.get('epsilon', 0.5), alpha=kwargs.get('alpha', 0.8), gamma=kwargs.get('gamma', 0.8),
+        seed=args.seed or 0, arm_states=args.arm_states, hand_states=args.hand_states,
+        velocity_threshold=args.threshold), args.output, hogwild.FIELDS))
+    trainer.start()
+    return shared, trainer
+
+def run_sweep(args, agent_kwargs):
+    import sweep
+
+    if args.load:
+        raise ValueError('Argument load invalid for a sweep')
+    grids = {}
+    for name in ('epsilons', 'alphas', 'gammas'):
+        grids[name] = sweep.parse_values(getattr(args, name))
+        if any(value < 0.0 or value > 1.0 for value in grids[name]):
+            raise ValueError('Argument %s invalid' % name)
+    rows = sweep.sweep(grids['epsilons'], grids['alphas'], grids['gammas'], args.steps,
+                       seeds=args.seeds, velocity_threshold=args.threshold, workers=args.workers,
+                       agent=args.agent, agent_kwargs=agent_kwargs,
+                       arm_states=args.arm_states, hand_states=args.hand_states, seed=args.seed or 0)
+    sweep.write_results(rows, args.output)
+
+def run_train(args):
+    """
+    Trains one agent, a sweep of them or Hogwild workers without a window.
+    """
+    import checkpoint
+    import sweep
+
+    kwargs, agent_kwargs = agent_options(args)
+    agent_kwargs.update(convergence_options(args))
+    if args.sweep:
+        run_sweep(args, agent_kwargs)
+        return
+    if args.hogwild is not None:
+        shared, trainer = start_hogwild(args, kwargs, agent_kwargs)
+        try:
+            trainer.join()
+            if args.save:
+                robot_env = training.make_environment(args.arm_states, args.hand_states)
+                agent = training.make_agent(robot_env, q_values=shared.table(readonly=True),
+                                            epsilon=kwargs.get('epsilon', 0.5), alpha=kwargs.get('alpha', 0.8),
+                                            gamma=kwargs.get('gamma', 0.8))
+                checkpoint.save_agent(agent, args.save, args.hogwild * args.steps)
+        finally:
+            shared.close()
+        return
+
+    params = {'agent': args.agent, 'agent_kwargs': agent_kwargs, 'arm_states': args.arm_states,
+              'hand_states': args.hand_states, 'epsilon': kwargs.get('epsilon', 0.5),
+              'alpha': kwargs.get('alpha', 0.8), 'gamma': kwargs.get('gamma', 0.8), 'seed': args.seed,
+              'steps': args.steps, 'velocity_threshold': args.threshold, 'load': args.load,
+              'override': [name for name in ('epsilon', 'alpha', 'gamma') if name in kwargs]}
+    agent, robot_env, row = sweep.train_trial(params)
+    sweep.write_results([row], args.output)
+    if args.save:
+        step_count = args.steps
+        if args.load:
+            step_count += checkpoint.read_checkpoint(args.load, mmap=True)[0]['step_count']
+        checkpoint.save_agent(agent, args.save, step_count)
+
+def run_eval(args):
+    """
+    Prints the gait cycle and velocity of the greedy policy of a checkpoint or the planned policy.
+    """
+    import checkpoint
+    import evaluation
+    from q_table import DenseQTable
+
+    kwargs, agent_kwargs = agent_options(args)
+    if args.load:
+        header, values = checkpoint.read_checkpoint(args.load, mmap=True)
+        robot_env = training.make_environment(*header['state_shape'])
+        q_values = DenseQTable(header['state_shape'], header['actions'], values=values)
+        agent = training.make_agent(robot_env, q_values=q_values)
+    elif args.agent == 'value-iteration':
+        robot_env = training.make_environment(args.arm_states, args.hand_states)
+        agent = training.make_agent(robot_env, args.agent, gamma=kwargs.get('gamma', 0.8))
+    else:
+        raise ValueError('Argument load required to evaluate a learning agent')
+
+    result = evaluation.evaluate_agent(agent, robot_env)
+    print('steps before the gait: %d (displacement %.6f)' % (result.transient_steps, result.transient_displacement))
+    print('gait: %d steps, displacement %.6f per cycle' % (result.cycle_steps, result.cycle_displacement))
+    print('velocity: %.6f per step' % result.velocity)
+    for state, action in result.cycle:
+        print('  %s %s' % (state, action))
+
+def run_gui(args):
+    kwargs, agent_kwargs = agent_options(args)
+    # headless runs, of a sweep or of the Hogwild workers, may stop once they have converged
+    training_kwargs = dict(agent_kwargs, **convergence_options(args))
+    if args.sweep:
+        run_sweep(args, training_kwargs)
+        return
+    from visuals import run
+
+    if args.turbo:
+        kwargs['turbo'] = True
+    if args.fps:
+        if args.fps <= 0.0:
+            raise ValueError('Argument fps invalid')
+        kwargs['fps'] = args.fps
+    if args.velocity_window:
+        if args.velocity_window < 1:
+            raise ValueError('Argument velocity-window invalid')
+        kwargs['velocity_window'] = args.velocity_window
+    if args.metrics:
+        kwargs['metrics'] = True
+    if args.metrics_file:
+        kwargs['metrics_file'] = args.metrics_file
+    if args.load:
+        kwargs['load'] = args.load
+    if args.save:
+        kwargs['save'] = args.save
+        kwargs['checkpoint_every'] = args.checkpoint_every
+
+    if args.hogwild is not None:
+        shared, trainer = start_hogwild(args, kwargs, training_kwargs)
+        try:
+            run(watch=shared.table(readonly=True), **kwargs)
+        finally:
+            trainer.join()
+            shared.close()
+    else:
         # missing kwargs is handled in game_visuals.App, no need to handle it here
         run(**kwargs)
-    else:
-        run()
+
+def main(argv):
+    # the flags without a command are those of gui, as before there were commands
+    if not argv or argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['gui'] + argv
+    if argv[0] == 'bench':
+        import benchmark
+
+        benchmark.main(argv[1:])
+        return
+    args = make_parser().parse_args(argv)
+    {'train': run_train, 'eval': run_eval, 'gui': run_gui}[args.command](args)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+
+PHASES = ('action', 'environment', 'update', 'sleep', 'render')
+
+class StepMetrics:
+    """
+    Accumulates the time spent in each phase of the training loop (see PHASES), the number
+    of steps and the reward collected. The training thread and the Tk thread may both add to it.
+    snapshot polls the totals and the rates since the previous snapshot; if a path is given,
+    log appends a snapshot as a JSON line at most every interval seconds, with rates since the
+    previous line, so polling and logging do not shift each other's rates.
+    """
+    def __init__(self, path=None, interval=1.0):
+        self.lock = threading.Lock()
+        self.phases = {phase: 0.0 for phase in PHASES}
+        self.steps = 0
+        self.reward = 0.0
+        self.start = time.perf_counter()
+        # totals at the previous snapshot, and at the previous line of the metrics file
+        self.last_snapshot = self.last_logged = {'time': 0.0, 'steps': 0, 'reward': 0.0}
+
+        self.path = path
+        self.interval = interval
+        self.file = open(path, 'a') if path else None
+        self.next_log = self.start + interval
+
+    def add(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] += seconds
+
+    def add_step(self, action, environment, update, reward):
+        with self.lock:
+            phases = self.phases
+            phases['action'] += action
+            phases['environment'] += environment
+            phases['update'] += update
+            self.steps += 1
+            self.reward += reward
+
+    def snapshot(self, since=None):
+        """
+        Returns the totals so far and the step and reward rates since the snapshot since, or
+        without it since the previous snapshot taken without since.
+        """
+        with self.lock:
+            now = time.perf_counter() - self.start
+            baseline = self.last_snapshot if since is None else since
+            elapsed = now - baseline['time']
+            steps = self.steps - baseline['steps']
+            reward = self.reward - baseline['reward']
+
+            total = sum(self.phases.values())
+            snapshot = {
+                'time': now,
+                'steps': self.steps,
+                'reward': self.reward,
+                'steps_per_sec': steps / elapsed if elapsed > 0 else 0.0,
+                'reward_per_sec': reward / elapsed if elapsed > 0 else 0.0,
+                'reward_per_step': reward / steps if steps else 0.0,
+                'phases': dict(self.phases),
+                'phase_fractions': {phase: t / total if total else 0.0 for phase, t in self.phases.items()},
+            }
+            if since is None:
+                self.last_snapshot = snapshot
+            return snapshot
+
+    def log(self):
+        """
+        Writes a snapshot to the metrics file if interval seconds have passed since the last one.
+        """
+        if self.file is None or time.perf_counter() < self.next_log:
+            return
+        self.last_logged = self.snapshot(self.last_logged)
+        self.file.write(json.dumps(self.last_logged) + '\n')
+        self.file.flush()
+        self.next_log = time.perf_counter() + self.interval
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,181 @@
+from array import array
+from collections import OrderedDict
+
+from util import Counter
+
+# tables with up to this many (state, action) entries are dense by default, 128 MB of doubles
+DENSE_LIMIT = 1 << 24
+
+# larger state spaces keep at most this many entries, each taking a few hundred bytes
+SPARSE_LIMIT = 1 << 19
+
+class KeyedQTable:
+    """
+    Greedy queries over Q-values keyed by (state, action) tuples.
+    """
+    def max_value(self, state, actions):
+        max_value = None
+        for a in actions:
+            q = self[(state, a)]
+            if max_value is None or q > max_value:
+                max_value = q
+        return max_value if max_value is not None else 0.0
+
+    def best_action(self, state, actions):
+        best_action = None
+        best_q = None
+        for a in actions:
+            q = self[(state, a)]
+            if best_q is None or q > best_q:
+                best_q = q
+                best_action = a
+        return best_action
+
+class SparseQTable(KeyedQTable, Counter):
+    """
+    Q-value storage keyed by (state, action) tuples, for state spaces of unknown size.
+    Reading a pair that was never written returns 0 without storing it, see Counter.
+    """
+
+class BoundedSparseQTable(KeyedQTable):
+    """
+    Q-value storage keyed by (state, action) tuples holding at most max_entries pairs.
+    Writing a new pair to a full table forgets the least recently written one, whose value
+    reverts to the default, so memory stays bounded however large the state space is.
+    """
+    def __init__(self, max_entries=SPARSE_LIMIT, default=0.0):
+        if max_entries < 1:
+            raise ValueError('Q-table must hold at least 1 entry')
+        self.max_entries = max_entries
+        self.default = default
+        self.values = OrderedDict()
+
+    def __getitem__(self, key):
+        return self.values.get(key, self.default)
+
+    def __setitem__(self, key, value):
+        values = self.values
+        if key in values:
+            values.move_to_end(key)
+        elif len(values) >= self.max_entries:
+            values.popitem(last=False)
+        values[key] = value
+
+    def __len__(self):
+        return len(self.values)
+
+class DenseQTable:
+    """
+    Q-value storage in one contiguous array of doubles, laid out as [state index][action index].
+    It is keyed by the integer IDs the agents learn with (see Environment.get_current_state_id):
+    table[(state index, action index)] reads and writes the value directly, with no hashing.
+    index converts a tuple of bucket numbers within state_shape and one of the given action names.
+    values may be given to wrap existing storage of the right length, such as a read-only
+    memoryview of a memory-mapped checkpoint.
+    """
+    def __init__(self, state_shape, actions, default=0.0, values=None):
+        self.state_shape = tuple(state_shape)
+        self.actions = tuple(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        self.n_actions = len(self.actions)
+
+        self.n_states = 1
+        for n in self.state_shape:
+            self.n_states *= n
+        if values is None:
+            values = array('d', [default]) * (self.n_states * self.n_actions)
+        elif len(values) != self.n_states * self.n_actions:
+            raise ValueError('Q-table of shape %s with %d actions needs %d values, got %d'
+                             % (self.state_shape, self.n_actions, self.n_states * self.n_actions, len(values)))
+        self.values = values
+
+    def state_index(self, state):
+        index = 0
+        for bucket, n in zip(state, self.state_shape):
+            index = index * n + bucket
+        return index
+
+    def index(self, state, action):
+        return self.state_index(state) * self.n_actions + self.action_index[action]
+
+    def __getitem__(self, key):
+        state, action = key
+        return self.values[state * self.n_actions + action]
+
+    def __setitem__(self, key, value):
+        state, action = key
+        self.values[state * self.n_actions + action] = value
+
+    def __len__(self):
+        return len(self.values)
+
+    def row(self, state):
+        """
+        Returns the Q-values of every action in a state index, in the order of self.actions.
+        """
+        start = state * self.n_actions
+        return self.values[start:start + self.n_actions]
+
+    def max_value(self, state, actions):
+        if not actions:
+            return 0.0
+        values = self.values
+        base = state * self.n_actions
+        return max([values[base + a] for a in actions])
+
+    def best_action(self, state, actions):
+        best_action = None
+        best_q = None
+        values = self.values
+        base = state * self.n_actions
+        for a in actions:
+            q = values[base + a]
+            if best_q is None or q > best_q:
+                best_q = q
+                best_action = a
+        return best_action
+
+    def greedy_actions(self, states, legal_actions):
+        """
+        Returns the best legal action index of every state index, the first of any ties.
+        """
+        values = self.values
+        n_actions = self.n_actions
+        actions = []
+        for s in states:
+            base = s * n_actions
+            legal = legal_actions[s]
+            row = [values[base + a] for a in legal]
+            actions.append(legal[row.index(max(row))])
+        return actions
+
+    def update_batch(self, states, actions, next_states, rewards, alpha, discount, legal_actions):
+        """
+        Applies a Q-learning backup for every transition, given as state indices, action indices,
+        next state indices and rewards. legal_actions holds the legal action indices of each state index.
+        Transitions are applied in order, so later ones see the updates of earlier ones.
+        Returns the Bellman error of each transition before its backup.
+        """
+        values = self.values
+        n_actions = self.n_actions
+        errors = []
+        for s, a, n, r in zip(states, actions, next_states, rewards):
+            base = n * n_actions
+            next_q = max([values[base + b] for b in legal_actions[n]]) if legal_actions[n] else 0.0
+            i = s * n_actions + a
+            error = r + discount * next_q - values[i]
+            values[i] += alpha * error
+            errors.append(error)
+        return errors
+
+def make_q_table(state_shape, actions, dense_limit=DENSE_LIMIT, sparse_limit=SPARSE_LIMIT):
+    """
+    Returns a DenseQTable if the state space has at most dense_limit (state, action) pairs,
+    otherwise a BoundedSparseQTable holding up to sparse_limit of them.
+    """
+    size = len(actions)
+    for n in state_shape:
+        size *= n
+    if size <= dense_limit:
+        return DenseQTable(state_shape, actions)
+    return BoundedSparseQTable(sparse_limit)
@@ -1,10 +1,17 @@
-import random
+import heapq
+import itertools
 from abc import abstractmethod
+from collections import deque
 
-from util import Counter, flip_coin, raiseNotDefined
+from convergence import ConvergenceMonitor
+from q_table import DenseQTable, SparseQTable
+from replay_buffer import PrioritizedReplayBuffer, ReplayBuffer
+from tile_coding import TileCodedQFunction, TileCoder
+from util import RandomStream, flip_coin, raiseNotDefined
 
 class ReinforcementAgent:
-    def __init__(self, actionFcn=None, num_training=100, epsilon=0.5, alpha=0.5, gamma=1):
+    def __init__(self, actionFcn=None, num_training=100, epsilon=0.5, alpha=0.5, gamma=1, seed=None,
+                 convergence_window=None, q_tolerance=1e-3, policy_tolerance=0.0):
         if actionFcn == None:
             actionFcn = lambda state: state.get_legal_actions()
         self.action_fcn = actionFcn
@@ -15,13 +22,43 @@ class ReinforcementAgent:
         self.epsilon = float(epsilon)
         self.alpha = float(alpha)
         self.discount = float(gamma)
+        # exploration and sampling draws, see RandomStream
+        self.rng = RandomStream(seed)
+        # with a window, each observed step records how much it changed the Q-value and
+        # greedy action of the state it backed up, see has_converged
+        self.convergence = None
+        if convergence_window:
+            self.convergence = ConvergenceMonitor(convergence_window, q_tolerance, policy_tolerance)
 
     def get_legal_actions(self, state):
         return self.action_fcn(state)
     
     def observe_transition(self, state, action, next_state, delta_rew):
         self.episode_rewards += delta_rew
+        pair = self.backup_pair(state, action) if self.convergence is not None else None
+        if pair is None:
+            self.update(state, action, next_state, delta_rew)
+            return
+        backup_state, backup_action = pair
+        old_q = self.get_qVal(backup_state, backup_action)
+        old_policy = self.get_policy(backup_state)
         self.update(state, action, next_state, delta_rew)
+        self.convergence.record(abs(self.get_qVal(backup_state, backup_action) - old_q),
+                                self.get_policy(backup_state) != old_policy)
+
+    def backup_pair(self, state, action):
+        """
+        Returns the (state, action) pair backed up by the update of a transition from state,
+        None if the update backs up nothing.
+        """
+        return state, action
+
+    def has_converged(self):
+        """
+        Returns whether the Q-values and greedy policy have stopped changing over the convergence
+        window, always False without one.
+        """
+        return self.convergence is not None and self.convergence.converged()
 
     def start_episode(self):
         self.last_state = None
@@ -54,6 +91,7 @@ class ReinforcementAgent:
 
     def set_discount(self, gamma):
         self.gamma = gamma
+        self.discount = float(gamma)
 
     def do_action(self, state, action):
         self.last_state = state
@@ -64,61 +102,338 @@ class ReinforcementAgent:
         raiseNotDefined()
 
 class QLearningAgent(ReinforcementAgent):
-    def __init__(self, **kwargs):
+    def __init__(self, q_values=None, **kwargs):
         ReinforcementAgent.__init__(self, **kwargs)
-        self.q_values = Counter()
+        # any table supporting [(state, action)], max_value and best_action, see q_table
+        self.q_values = q_values if q_values is not None else SparseQTable()
 
     def get_qVal(self, state, action):
         return self.q_values[(state, action)]
     
     def compute_val_from_qVal(self, state):
-        max_value = None
-        legal_actions = self.get_legal_actions(state)
-        for a in legal_actions:
-            q = self.get_qVal(state, a)
-            if max_value is None or q > max_value:
-                max_value = q
-        return max_value if max_value is not None else 0.0
+        return self.q_values.max_value(state, self.get_legal_actions(state))
     
     def compute_action_from_qVal(self, state):
-        best_action = None
-        best_q = None
-        legal_actions = self.get_legal_actions(state)
-        for a in legal_actions:
-          q = self.get_qVal(state, a)
-          if best_q is None or q > best_q:
-            best_q = q
-            best_action = a
-        return best_action
+        return self.q_values.best_action(state, self.get_legal_actions(state))
     
     def get_action(self, state):
         legalActions = self.get_legal_actions(state)
         action = None
         
-        if flip_coin(self.epsilon):
+        if flip_coin(self.epsilon, self.rng):
           if len(legalActions) > 0:
-            action = random.choice(legalActions)
+            action = self.rng.choice(legalActions)
         else:
-          action = self.compute_action_from_qVal(state)
+          action = self.q_values.best_action(state, legalActions)
         return action
 
     def update(self, state, action, nextState, reward):
         # Q_k+1(s, a) = (1 - alpha) Q_k(s, a) + alpha [R(s, a, s') + gamma max_a'{Q(s', a')}]
-        # find max_a'{Q(s', a')}
-        next_actions = self.get_legal_actions(nextState)
-        next_q = None
-        for a in next_actions:
-          exploration_fcn = self.get_qVal(nextState, a)
-          if next_q is None or exploration_fcn > next_q:
-            next_q = exploration_fcn
-        if next_q is not None:
-          new_q = (1 - self.alpha) * self.get_qVal(state, action) + self.alpha * (reward + self.discount * next_q)
-        else:
-          new_q = (1 - self.alpha) * self.get_qVal(state, action) + self.alpha * (reward)
+        # find max_a'{Q(s', a')}, 0 if s' has no legal actions
+        next_q = self.q_values.max_value(nextState, self.get_legal_actions(nextState))
+        new_q = (1 - self.alpha) * self.get_qVal(state, action) + self.alpha * (reward + self.discount * next_q)
         self.q_values[(state, action)] = new_q
           
     def get_policy(self, state):
         return self.compute_action_from_qVal(state)
 
     def get_value(self, state):
-        return self.compute_val_from_qVal(state)
\ No newline at end of file
+        return self.compute_val_from_qVal(state)
+
+class WatkinsQLambdaAgent(QLearningAgent):
+    """
+    Watkins's Q(lambda): each update also backs up the recently visited (state, action) pairs in
+    proportion to their eligibility trace, which decays by gamma * trace_decay per step. Traces are
+    cut whenever an exploratory action is taken. Only traces above min_trace are kept, so the
+    work per step stays bounded no matter how large the state space is.
+    """
+    def __init__(self, trace_decay=0.9, min_trace=0.01, **kwargs):
+        QLearningAgent.__init__(self, **kwargs)
+        self.trace_decay = float(trace_decay)
+        self.min_trace = float(min_trace)
+        self.traces = {}
+
+    def start_episode(self):
+        QLearningAgent.start_episode(self)
+        self.traces = {}
+
+    def get_action(self, state):
+        action = QLearningAgent.get_action(self, state)
+        # the traces only follow the greedy policy
+        if self.traces and action is not None and self.get_qVal(state, action) < self.compute_val_from_qVal(state):
+            self.traces.clear()
+        return action
+
+    def update(self, state, action, nextState, reward):
+        q_values = self.q_values
+        next_q = q_values.max_value(nextState, self.get_legal_actions(nextState))
+        delta = reward + self.discount * next_q - q_values[(state, action)]
+
+        # replacing traces
+        traces = self.traces
+        traces[(state, action)] = 1.0
+        step = self.alpha * delta
+        decay = self.discount * self.trace_decay
+        for key, trace in list(traces.items()):
+            q_values[key] += step * trace
+            trace *= decay
+            if trace < self.min_trace:
+                del traces[key]
+            else:
+                traces[key] = trace
+
+class NStepQLearningAgent(QLearningAgent):
+    """
+    n-step Q-learning: a (state, action) pair is backed up once n_steps transitions later, towards
+    the discounted sum of their rewards plus the discounted value of the state reached.
+    As with the traces of Watkins's Q(lambda), returns only follow the greedy policy: when an
+    exploratory action is taken, the pending transitions are backed up with fewer steps, ending
+    in the state it was taken from. So are those still pending at the end of an episode.
+    """
+    def __init__(self, n_steps=4, **kwargs):
+        QLearningAgent.__init__(self, **kwargs)
+        self.n_steps = int(n_steps)
+        if self.n_steps < 1:
+            raise ValueError('n-step Q-learning needs at least 1 step')
+        self.pending = deque()
+        self.last_next_state = None
+
+    def start_episode(self):
+        QLearningAgent.start_episode(self)
+        self.pending.clear()
+        self.last_next_state = None
+
+    def end_episode(self):
+        while self.pending:
+            self.backup(self.last_next_state)
+        QLearningAgent.end_episode(self)
+
+    def get_action(self, state):
+        action = QLearningAgent.get_action(self, state)
+        if self.pending and action is not None and self.get_qVal(state, action) < self.compute_val_from_qVal(state):
+            while self.pending:
+                self.backup(state)
+        return action
+
+    def backup_pair(self, state, action):
+        if len(self.pending) + 1 < self.n_steps:
+            return None
+        return self.pending[0][:2] if self.pending else (state, action)
+
+    def update(self, state, action, nextState, reward):
+        self.pending.append((state, action, reward))
+        self.last_next_state = nextState
+        if len(self.pending) >= self.n_steps:
+            self.backup(nextState)
+
+    def backup(self, last_state):
+        """
+        Backs up the oldest pending transition towards the return that ends in last_state.
+        """
+        target = self.q_values.max_value(last_state, self.get_legal_actions(last_state))
+        for state, action, reward in reversed(self.pending):
+            target = reward + self.discount * target
+        state, action, reward = self.pending.popleft()
+        q = self.get_qVal(state, action)
+        self.q_values[(state, action)] = q + self.alpha * (target - q)
+
+class DynaQAgent(QLearningAgent):
+    """
+    Dyna-Q with prioritized sweeping. Every real transition is recorded in a deterministic model
+    of the environment and backed up as in Q-learning. The agent then performs up to planning_steps
+    simulated backups from the model. They are taken from a priority queue ordered by the size of
+    each pair's Bellman error, and a backup queues the predecessors of its state whose error now
+    exceeds threshold. The model keeps every pair observed, so its memory grows with the
+    visited part of the state space.
+    """
+    def __init__(self, planning_steps=10, threshold=1e-4, **kwargs):
+        QLearningAgent.__init__(self, **kwargs)
+        self.planning_steps = int(planning_steps)
+        self.threshold = float(threshold)
+        # (state, action) -> (next state, reward) of the last observed transition
+        self.model = {}
+        # state -> set of (state, action) pairs observed to lead to it
+        self.predecessors = {}
+        # heap of (-priority, order, (state, action)), order breaks ties first in first out;
+        # queued holds the current priority of each pair so outdated heap entries are skipped
+        self.queue = []
+        self.queued = {}
+        self.order = itertools.count()
+
+    def bellman_error(self, state, action, next_state, reward):
+        next_q = self.q_values.max_value(next_state, self.get_legal_actions(next_state))
+        return reward + self.discount * next_q - self.q_values[(state, action)]
+
+    def queue_predecessors(self, state):
+        for pair in self.predecessors.get(state, ()):
+            next_state, reward = self.model[pair]
+            priority = abs(self.bellman_error(pair[0], pair[1], next_state, reward))
+            if priority > self.threshold and priority > self.queued.get(pair, 0.0):
+                self.queued[pair] = priority
+                heapq.heappush(self.queue, (-priority, next(self.order), pair))
+
+    def update(self, state, action, nextState, reward):
+        pair = (state, action)
+        previous = self.model.get(pair)
+        if previous is not None and previous[0] != nextState:
+            self.predecessors[previous[0]].discard(pair)
+        self.model[pair] = (nextState, reward)
+        self.predecessors.setdefault(nextState, set()).add(pair)
+
+        QLearningAgent.update(self, state, action, nextState, reward)
+        self.queue_predecessors(state)
+        self.plan()
+
+    def plan(self):
+        """
+        Performs up to planning_steps backups of the highest priority pairs in the queue.
+        """
+        queue = self.queue
+        queued = self.queued
+        backups = 0
+        while backups < self.planning_steps and queue:
+            priority, order, pair = heapq.heappop(queue)
+            if queued.get(pair) != -priority:
+                continue
+            del queued[pair]
+            backups += 1
+
+            state, action = pair
+            next_state, reward = self.model[(state, action)]
+            q = self.q_values[(state, action)]
+            self.q_values[(state, action)] = q + self.alpha * self.bellman_error(state, action, next_state, reward)
+            self.queue_predecessors(state)
+
+class ReplayQLearningAgent(QLearningAgent):
+    """
+    Q-learning from experience replay. Every observed transition is stored in a replay buffer,
+    then a minibatch of it and batch_size - 1 sampled transitions is backed up in one
+    DenseQTable.update_batch pass. With prioritized=True transitions are sampled by their
+    last Bellman error (see PrioritizedReplayBuffer) instead of uniformly.
+    """
+    def __init__(self, buffer_size=10000, batch_size=32, prioritized=False, **kwargs):
+        QLearningAgent.__init__(self, **kwargs)
+        if not isinstance(self.q_values, DenseQTable):
+            raise ValueError('Experience replay needs a DenseQTable')
+        self.batch_size = int(batch_size)
+        if self.batch_size < 1:
+            raise ValueError('Replay batch size must be at least 1')
+        buffer_size = int(buffer_size)
+        if prioritized:
+            self.buffer = PrioritizedReplayBuffer(buffer_size, rng=self.rng)
+        else:
+            self.buffer = ReplayBuffer(buffer_size, rng=self.rng)
+        # legal action indices per state index, filled in as next states are observed
+        self.legal_action_ids = [()] * self.q_values.n_states
+
+    def update(self, state, action, nextState, reward):
+        q_values = self.q_values
+        if not self.legal_action_ids[nextState]:
+            self.legal_action_ids[nextState] = tuple(self.get_legal_actions(nextState))
+
+        newest = self.buffer.add(state, action, reward, nextState)
+        positions = [newest] + self.buffer.sample(min(self.batch_size, len(self.buffer)) - 1)
+        errors = q_values.update_batch(*self.buffer.get_batch(positions), self.alpha, self.discount, self.legal_action_ids)
+        self.buffer.update_priorities(positions, errors)
+
+class LinearQAgent(QLearningAgent):
+    """
+    Q-learning with a linear function of tile-coded crawler angles instead of a table
+    (see TileCodedQFunction). Each state is coded from the arm and hand angles the crawler
+    holds in it, so neighbouring angles share what they learn, and the weights take the same
+    memory at any resolution of the environment. Every backup is a semi-gradient step of
+    alpha / n_tilings per active tile. Sharing pays off on fine grids at discounts around 0.95,
+    where it finds a good gait in fewer steps than a table; with discounts near 1 the shared
+    weights can settle on a policy that does not move.
+    """
+    def __init__(self, environment, n_tiles=8, n_tilings=8, **kwargs):
+        if kwargs.get('actionFcn') is None:
+            kwargs['actionFcn'] = environment.get_possible_action_ids
+        robot = environment.robot
+        min_arm_angle, max_arm_angle = robot.get_arm_minmax_angle()
+        min_hand_angle, max_hand_angle = robot.get_hand_minmax_angle()
+        coder = TileCoder((min_arm_angle, min_hand_angle), (max_arm_angle, max_hand_angle), n_tiles, n_tilings)
+        q_values = TileCodedQFunction(coder, environment.get_state_angles,
+                                      range(len(environment.get_all_actions())))
+        QLearningAgent.__init__(self, q_values=q_values, **kwargs)
+
+class ValueIterationAgent(ReinforcementAgent):
+    """
+    Plans an optimal policy with value iteration over the environment's deterministic
+    transition table instead of learning it from experience, so update does nothing.
+    The discount must be below 1 for the values to converge; otherwise solving stops
+    after the given number of iterations.
+    """
+    def __init__(self, environment, iterations=10000, tolerance=1e-9, **kwargs):
+        if kwargs.get('actionFcn') is None:
+            kwargs['actionFcn'] = environment.get_possible_action_ids
+        ReinforcementAgent.__init__(self, **kwargs)
+        self.environment = environment
+        self.iterations = int(iterations)
+        self.tolerance = float(tolerance)
+        self.solve()
+
+    def solve(self):
+        transitions = self.environment.get_transitions().fill_all()
+        self.actions = self.environment.get_all_actions()
+        self.n_arm_states, self.n_hand_states = self.environment.get_state_shape()
+        n_states = self.n_arm_states * self.n_hand_states
+        n_actions = len(self.actions)
+
+        # (action index, next state index, reward) of every legal action, per state index
+        self.model = []
+        for s in range(n_states):
+            moves = []
+            for a in range(n_actions):
+                next_index = transitions.next_index[s * n_actions + a]
+                if next_index >= 0:
+                    moves.append((a, next_index, transitions.reward[s * n_actions + a]))
+            self.model.append(moves)
+
+        discount = self.discount
+        values = [0.0] * n_states
+        self.iterations_run = 0
+        while self.iterations_run < self.iterations:
+            new_values = [max([r + discount * values[n] for a, n, r in moves]) if moves else 0.0
+                          for moves in self.model]
+            delta = max([abs(new - old) for new, old in zip(new_values, values)])
+            values = new_values
+            self.iterations_run += 1
+            if delta < self.tolerance:
+                break
+        self.values = values
+
+        self.policy = []
+        for moves in self.model:
+            best_action = None
+            best_q = None
+            for a, n, r in moves:
+                q = r + discount * values[n]
+                if best_q is None or q > best_q:
+                    best_q = q
+                    best_action = a
+            self.policy.append(best_action)
+
+    def set_discount(self, gamma):
+        changed = float(gamma) != self.discount
+        ReinforcementAgent.set_discount(self, gamma)
+        if changed:
+            self.solve()
+
+    def get_qVal(self, state, action):
+        for a, n, r in self.model[state]:
+            if a == action:
+                return r + self.discount * self.values[n]
+        return 0.0
+
+    def get_action(self, state):
+        return self.get_policy(state)
+
+    def update(self, state, action, nextState, reward):
+        pass
+
+    def get_policy(self, state):
+        return self.policy[state]
+
+    def get_value(self, state):
+        return self.values[state]
@@ -0,0 +1,112 @@
+from array import array
+
+from util import RandomStream
+
+class ReplayBuffer:
+    """
+    Fixed-capacity store of transitions as parallel arrays of state indices, action indices,
+    rewards and next state indices. Once full, each new transition overwrites the oldest one.
+    sample draws positions uniformly with replacement from rng, a RandomStream.
+    """
+    def __init__(self, capacity, rng=None):
+        if capacity < 1:
+            raise ValueError('Replay buffer capacity must be at least 1')
+        self.capacity = capacity
+        self.rng = rng if rng is not None else RandomStream()
+        self.states = array('l', [0]) * capacity
+        self.actions = array('l', [0]) * capacity
+        self.rewards = array('d', [0.0]) * capacity
+        self.next_states = array('l', [0]) * capacity
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, state, action, reward, next_state):
+        """
+        Stores a transition and returns its position in the buffer.
+        """
+        i = self.head
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.head = 0 if i + 1 == self.capacity else i + 1
+        if self.count < self.capacity:
+            self.count += 1
+        return i
+
+    def sample(self, batch_size):
+        """
+        Returns the positions of batch_size stored transitions.
+        """
+        count = self.count
+        return [int(x * count) for x in self.rng.block(batch_size)]
+
+    def get_batch(self, positions):
+        """
+        Returns lists of the states, actions, next states and rewards at the given positions,
+        in the argument order of DenseQTable.update_batch.
+        """
+        return ([self.states[i] for i in positions], [self.actions[i] for i in positions],
+                [self.next_states[i] for i in positions], [self.rewards[i] for i in positions])
+
+    def update_priorities(self, positions, errors):
+        pass
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Replay buffer sampling transitions in proportion to (|error| + epsilon) ** exponent, where
+    error is the last Bellman error of the transition. Priorities live in a sum tree, so adding,
+    sampling and updating are O(log capacity). New transitions get the highest priority seen so
+    far so they are replayed at least once. Samples are not reweighted for the bias this brings.
+    """
+    def __init__(self, capacity, exponent=0.6, epsilon=1e-3, rng=None):
+        ReplayBuffer.__init__(self, capacity, rng)
+        self.exponent = exponent
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        # leaves of the tree start at index size, node i sums nodes 2i and 2i + 1
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+        self.tree = array('d', [0.0]) * (2 * self.size)
+
+    def set_priority(self, position, priority):
+        tree = self.tree
+        i = position + self.size
+        tree[i] = priority
+        i //= 2
+        while i:
+            tree[i] = tree[2 * i] + tree[2 * i + 1]
+            i //= 2
+
+    def add(self, state, action, reward, next_state):
+        position = ReplayBuffer.add(self, state, action, reward, next_state)
+        self.set_priority(position, self.max_priority)
+        return position
+
+    def sample(self, batch_size):
+        tree = self.tree
+        size = self.size
+        total = tree[1]
+        positions = []
+        for x in self.rng.block(batch_size):
+            x *= total
+            i = 1
+            while i < size:
+                i *= 2
+                if x >= tree[i]:
+                    x -= tree[i]
+                    i += 1
+            # rounding can walk off the stored leaves
+            positions.append(min(i - size, self.count - 1))
+        return positions
+
+    def update_priorities(self, positions, errors):
+        for position, error in zip(positions, errors):
+            priority = (abs(error) + self.epsilon) ** self.exponent
+            if priority > self.max_priority:
+                self.max_priority = priority
+            self.set_priority(position, priority)
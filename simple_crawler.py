@@ -1,19 +1,26 @@
 import math
+from collections import namedtuple
 from math import pi as PI
 
-class SimpleCrawler:
-    def __init__(self, canvas):
-        self.canvas = canvas
-        self.vel_avg = 0
-        self.last_step = 0
-
-        self.width = canvas.winfo_reqwidth()
-        self.height = canvas.winfo_reqheight()
+from trajectory import TrajectoryRecorder
+
+# immutable pose and velocity readouts of a crawler after a step, published by the
+# training thread and drawn by the Tk thread so neither reads the other's mutable state
+CrawlerSnapshot = namedtuple('CrawlerSnapshot', ['step_count', 'position', 'arm_angle', 'hand_angle',
+                                                 'velocity', 'window_velocity', 'ema_velocity'])
+
+class CrawlerPhysics:
+    """
+    Kinematics and displacement model of the crawler, with no dependency on a GUI toolkit.
+    Headless training uses this class directly; SimpleCrawler adds canvas rendering on top.
+    The last window positions are kept in self.positions, see TrajectoryRecorder.
+    """
+    def __init__(self, width=1000, height=200, window=100):
+        self.width = width
+        self.height = height
         self.ground_height = 40
         self.groundY = self.height - self.ground_height
 
-        self.ground = canvas.create_rectangle(0, self.groundY, self.width, self.height, fill='blue')
-
         self.arm_angle = self.old_arm_degree = 0.0
         self.hand_angle = self.old_hand_degree = -PI / 6
 
@@ -26,24 +33,21 @@ class SimpleCrawler:
         self.robot_width = 80
         self.robot_height = 40
         self.position = (20, self.groundY)
-        self.robot_body = canvas.create_polygon(0,0,0,0,0,0,0,0, fill='green')
 
         self.arm_length = 60
-        self.robot_arm = canvas.create_line(0,0,0,0, fill='orange', width=5)
-
         self.hand_length = 40
-        self.robot_hand = canvas.create_line(0,0,0,0, fill='red', width=3)
 
-        self.positions = [0,0]
+        self.positions = TrajectoryRecorder(window)
+        self.positions.reset(0, 0)
 
-    def __get_cos_and_sin(self, angle):
+    def _get_cos_and_sin(self, angle):
         return math.cos(angle), math.sin(angle)
     
     def __displacement(self, old_arm_deg, old_hand_deg, arm_deg, hand_deg):
-        old_arm_cos, old_arm_sin = self.__get_cos_and_sin(old_arm_deg)
-        arm_cos, arm_sin = self.__get_cos_and_sin(arm_deg)
-        old_hand_cos, old_hand_sin = self.__get_cos_and_sin(old_hand_deg)
-        hand_cos, hand_sin = self.__get_cos_and_sin(hand_deg)
+        old_arm_cos, old_arm_sin = self._get_cos_and_sin(old_arm_deg)
+        arm_cos, arm_sin = self._get_cos_and_sin(arm_deg)
+        old_hand_cos, old_hand_sin = self._get_cos_and_sin(old_hand_deg)
+        hand_cos, hand_sin = self._get_cos_and_sin(hand_deg)
 
         x_old = self.arm_length * old_arm_cos + self.hand_length * old_hand_cos + self.robot_width
         y_old = self.arm_length * old_arm_sin + self.hand_length * old_hand_sin + self.robot_height
@@ -70,18 +74,30 @@ class SimpleCrawler:
     def get_position(self):
         return self.position
     
+    def get_displacement(self, old_arm_angle, old_hand_angle, arm_angle, hand_angle):
+        return self.__displacement(old_arm_angle, old_hand_angle, arm_angle, hand_angle)
+
+    def get_geometry(self):
+        return self.arm_length, self.hand_length, self.robot_width, self.robot_height
+
+    def move_to(self, arm_angle, hand_angle, disp):
+        """
+        Sets the angles and shifts the robot by a displacement computed beforehand.
+        Angles are not checked against their limits.
+        """
+        self.position = (self.position[0]+disp, self.position[1])
+        self.arm_angle = arm_angle
+        self.hand_angle = hand_angle
+
+        self.positions.push(self.position[0])
+
     def move_arm(self, new_arm_angle):
         if new_arm_angle > self.max_arm_angle:
             raise Exception('Crawling Robot: Arm Raised too high. Careful!')
         if new_arm_angle < self.min_arm_angle:
             raise Exception('Crawling Robot: Arm Raised too low. Careful!')
         disp = self.__displacement(self.arm_angle, self.hand_angle, new_arm_angle, self.hand_angle)
-        self.position = (self.position[0]+disp, self.position[1])
-        self.arm_angle = new_arm_angle
-
-        self.positions.append(self.get_position()[0])
-        if len(self.positions) > 100:
-            self.positions.pop(0)
+        self.move_to(new_arm_angle, self.hand_angle, disp)
 
     def move_hand(self, new_hand_angle):
         if new_hand_angle > self.max_hand_angle:
@@ -89,12 +105,7 @@ class SimpleCrawler:
         if new_hand_angle < self.min_hand_angle:
             raise Exception('Crawling Robot: Hand Raised too low. Careful!')
         disp = self.__displacement(self.arm_angle, self.hand_angle, self.arm_angle, new_hand_angle)
-        self.position = (self.position[0]+disp, self.position[1])
-        self.hand_angle = new_hand_angle
-
-        self.positions.append(self.get_position()[0])
-        if len(self.positions) > 100:
-            self.positions.pop(0)
+        self.move_to(self.arm_angle, new_hand_angle, disp)
 
     def get_arm_minmax_angle(self):
         return self.min_arm_angle, self.max_arm_angle
@@ -102,25 +113,64 @@ class SimpleCrawler:
     def get_hand_minmax_angle(self):
         return self.min_hand_angle, self.max_hand_angle
     
-    def get_rotation_angle(self):
-        arm_cos, arm_sin = self.__get_cos_and_sin(self.arm_angle)
-        hand_cos, hand_sin = self.__get_cos_and_sin(self.hand_angle)
+    def snapshot(self, step_count):
+        """
+        Returns the current pose with the velocity statistics of the recorded positions.
+        """
+        positions = self.positions
+        return CrawlerSnapshot(step_count, self.position, self.arm_angle, self.hand_angle,
+                               positions.velocity(), positions.window_velocity(), positions.ema_velocity)
+
+    def get_rotation_angle(self, arm_angle=None, hand_angle=None):
+        if arm_angle is None:
+            arm_angle, hand_angle = self.arm_angle, self.hand_angle
+        arm_cos, arm_sin = self._get_cos_and_sin(arm_angle)
+        hand_cos, hand_sin = self._get_cos_and_sin(hand_angle)
         x = self.arm_length * arm_cos + self.hand_length * hand_cos + self.robot_width
         y = self.arm_length * arm_sin + self.hand_length * hand_sin + self.robot_height
         if y < 0:
             return math.atan(-y / x)
         return 0.0
 
+class SimpleCrawler(CrawlerPhysics):
+    """
+    Crawler rendered on a tkinter canvas.
+    Canvas items, including the text readouts, are created once and updated in place.
+    """
+    def __init__(self, canvas, window=100):
+        CrawlerPhysics.__init__(self, canvas.winfo_reqwidth(), canvas.winfo_reqheight(), window)
+        self.canvas = canvas
+        # step count of the last drawn frame, -1 so the first frame is always drawn
+        self.last_step = -1
+
+        self.ground = canvas.create_rectangle(0, self.groundY, self.width, self.height, fill='blue')
+        self.robot_body = canvas.create_polygon(0,0,0,0,0,0,0,0, fill='green')
+        self.robot_arm = canvas.create_line(0,0,0,0, fill='orange', width=5)
+        self.robot_hand = canvas.create_line(0,0,0,0, fill='red', width=3)
+
+        self.velavg_msg = canvas.create_text(650,190,text='')
+        self.vel_msg = canvas.create_text(450,190,text='')
+        self.pos_msg = canvas.create_text(250,190,text='')
+        self.step_msg = canvas.create_text(50,190,text='')
+
     def draw(self, step_count, step_delay):
-        x1, y1 = self.get_position()
+        self.draw_snapshot(self.snapshot(step_count))
+
+    def draw_snapshot(self, snapshot):
+        # nothing moved since the last frame
+        if snapshot.step_count == self.last_step:
+            return
+        self.last_step = snapshot.step_count
+
+        x1, y1 = snapshot.position
         x1 = x1 % self.width
 
         ## Check Lower Still on the ground
         if y1 != self.groundY:
             raise Exception('Flying Robot!!')
 
-        rotation_angle = self.get_rotation_angle()
-        cos_rotation, sin_rotation = self.__get_cos_and_sin(rotation_angle)
+        rotation_angle = self.get_rotation_angle(snapshot.arm_angle, snapshot.hand_angle)
+        cos_rotation, sin_rotation = self._get_cos_and_sin(rotation_angle)
 
         x2 = x1 + self.robot_width * cos_rotation
         y2 = y1 - self.robot_width * sin_rotation
@@ -133,36 +183,20 @@ class SimpleCrawler:
 
         self.canvas.coords(self.robot_body,x1,y1,x2,y2,x4,y4,x3,y3)
 
-        arm_cos, arm_sin = self.__get_cos_and_sin(rotation_angle+self.arm_angle)
+        arm_cos, arm_sin = self._get_cos_and_sin(rotation_angle+snapshot.arm_angle)
         xArm = x4 + self.arm_length * arm_cos
         yArm = y4 - self.arm_length * arm_sin
 
         self.canvas.coords(self.robot_arm,x4,y4,xArm,yArm)
 
-        hand_cos, hand_sin = self.__get_cos_and_sin(rotation_angle+self.hand_angle)
+        hand_cos, hand_sin = self._get_cos_and_sin(rotation_angle+snapshot.hand_angle)
         xHand = xArm + self.hand_length * hand_cos
         yHand = yArm - self.hand_length * hand_sin
 
         self.canvas.coords(self.robot_hand,xArm,yArm,xHand,yHand)
 
-        steps = step_count - self.last_step
-        if steps == 0: return
-
-        pos = self.positions[-1]
-        velocity = pos - self.positions[-2]
-        vel2 = (pos - self.positions[0]) / len(self.positions)
-        self.vel_avg = .9 * self.vel_avg + .1 * vel2
-        vel_msg = '100-step Avg Velocity: %.2f' % self.vel_avg
-        velocity_msg = 'Velocity: %.2f' % velocity
-        position_msg = 'Position: %2.f' % pos
-        step_msg = 'Step: %d' % step_count
-        if 'vel_msg' in dir(self):
-            self.canvas.delete(self.vel_msg)
-            self.canvas.delete(self.pos_msg)
-            self.canvas.delete(self.step_msg)
-            self.canvas.delete(self.velavg_msg)
-        self.velavg_msg = self.canvas.create_text(650,190,text=vel_msg)
-        self.vel_msg = self.canvas.create_text(450,190,text=velocity_msg)
-        self.pos_msg = self.canvas.create_text(250,190,text=position_msg)
-        self.step_msg = self.canvas.create_text(50,190,text=step_msg)
-        self.lastStep = step_count
\ No newline at end of file
+        # averaged over steps by the recorder, so the readout does not depend on the frame rate
+        self.canvas.itemconfigure(self.velavg_msg, text='%d-step Avg Velocity: %.2f' % (self.positions.window, snapshot.window_velocity))
+        self.canvas.itemconfigure(self.vel_msg, text='Velocity: %.2f' % snapshot.velocity)
+        self.canvas.itemconfigure(self.pos_msg, text='Position: %2.f' % snapshot.position[0])
+        self.canvas.itemconfigure(self.step_msg, text='Step: %d' % snapshot.step_count)
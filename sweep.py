@@ -0,0 +1,85 @@
+import csv
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import checkpoint
+import evaluation
+import training
+
+FIELDS = ['agent', 'epsilon', 'alpha', 'gamma', 'seed', 'avg_velocity', 'greedy_velocity', 'threshold_step', 'converged_step', 'wall_time']
+
+def parse_values(text):
+    """
+    Parses a comma separated list of floats ('0.1,0.5,0.9') or an inclusive
+    range of evenly spaced floats written as start:stop:count ('0.1:0.9:5').
+    """
+    if ':' in text:
+        start, stop, count = text.split(':')
+        start, stop, count = float(start), float(stop), int(count)
+        if count < 2:
+            return [start]
+        inc = (stop - start) / (count - 1)
+        return [round(start + inc * i, 10) for i in range(count)]
+    return [float(value) for value in text.split(',')]
+
+def train_trial(params):
+    """
+    Trains one headless agent, params is a dict of agent (see training.AGENTS), agent_kwargs,
+    arm_states, hand_states, epsilon, alpha, gamma, seed, steps and velocity_threshold, and
+    optionally load, a checkpoint to resume from. The checkpoint's epsilon, alpha and gamma are
+    kept, except those named in override. Returns the agent, its environment and a row of the
+    results table with the parameters the agent trained with and the exact velocity of its
+    greedy policy.
+    """
+    robot_env = training.make_environment(params['arm_states'], params['hand_states'])
+    agent = training.make_agent(robot_env, params['agent'], epsilon=params['epsilon'], alpha=params['alpha'],
+                                gamma=params['gamma'], seed=params['seed'], **params['agent_kwargs'])
+    if params.get('load'):
+        checkpoint.load_agent(agent, params['load'])
+        override = params.get('override', ())
+        if 'epsilon' in override:
+            agent.set_epsilon(params['epsilon'])
+        if 'alpha' in override:
+            agent.set_learning_rate(params['alpha'])
+        if 'gamma' in override:
+            agent.set_discount(params['gamma'])
+    row = {'agent': params['agent'], 'epsilon': agent.epsilon, 'alpha': agent.alpha, 'gamma': agent.discount,
+           'seed': params['seed']}
+    result = training.train(agent, robot_env, params['steps'], velocity_threshold=params['velocity_threshold'])
+    row.update(result)
+    row['greedy_velocity'] = evaluation.evaluate_agent(agent, robot_env).velocity
+    return agent, robot_env, row
+
+def run_trial(params):
+    """
+    Trains one headless agent and returns its row of the results table, see train_trial.
+    """
+    return train_trial(params)[2]
+
+def sweep(epsilons, alphas, gammas, steps, seeds=1, velocity_threshold=1.5, workers=None,
+          agent='qlearning', agent_kwargs=None, arm_states=9, hand_states=13, seed=0):
+    """
+    Trains an agent for every combination of the parameters and seeds seed to seed+seeds-1
+    in a pool of worker processes, one per core by default.
+    """
+    trials = [{'agent': agent, 'agent_kwargs': agent_kwargs or {}, 'arm_states': arm_states, 'hand_states': hand_states,
+               'epsilon': epsilon, 'alpha': alpha, 'gamma': gamma, 'seed': seed,
+               'steps': steps, 'velocity_threshold': velocity_threshold}
+              for epsilon, alpha, gamma, seed in itertools.product(epsilons, alphas, gammas, range(seed, seed + seeds))]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return list(pool.map(run_trial, trials))
+
+def write_results(rows, path=None, fields=FIELDS):
+    """
+    Writes the results table as CSV to a file, or to stdout if no path is given.
+    """
+    out = open(path, 'w', newline='') if path else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if path:
+            out.close()
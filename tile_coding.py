@@ -0,0 +1,104 @@
+import math
+from array import array
+
+class TileCoder:
+    """
+    Tile coding of points in a box given by lows and highs. Each of n_tilings grids splits every
+    dimension into n_tiles tiles and is shifted by a different fraction of a tile, with odd
+    offsets per dimension so the tilings do not line up along the diagonal. A point activates
+    exactly one tile per tiling, and nearby points share most of their tiles.
+    """
+    def __init__(self, lows, highs, n_tiles=8, n_tilings=8):
+        if n_tiles < 1 or n_tilings < 1:
+            raise ValueError('Tile coding needs at least 1 tile and 1 tiling')
+        self.lows = tuple(lows)
+        self.scales = tuple(n_tiles / (high - low) for low, high in zip(lows, highs))
+        self.n_tiles = n_tiles
+        self.n_tilings = n_tilings
+        # a shifted grid covers the box with n_tiles + 1 tiles per dimension
+        self.tiles_per_tiling = (n_tiles + 1) ** len(self.lows)
+        self.n_features = n_tilings * self.tiles_per_tiling
+        self.offsets = [tuple((2 * d + 1) * t / n_tilings % 1.0 for d in range(len(self.lows)))
+                        for t in range(n_tilings)]
+
+    def tiles(self, point):
+        """
+        Returns the index of the active tile of every tiling, points outside the box are clamped.
+        """
+        n_tiles = self.n_tiles
+        scaled = [min(max((x - low) * scale, 0.0), n_tiles) for x, low, scale in zip(point, self.lows, self.scales)]
+        active = []
+        base = 0
+        for offsets in self.offsets:
+            index = 0
+            for x, offset in zip(scaled, offsets):
+                index = index * (n_tiles + 1) + math.floor(x + offset)
+            active.append(base + index)
+            base += self.tiles_per_tiling
+        return active
+
+class TileCodedQFunction:
+    """
+    Linear Q-function over tile-coded features, with one weight per tile and action, so its size
+    depends only on the tile coder. state_features maps a state to the point that is tile coded.
+    It stands in for a Q-table: reading a (state, action) pair sums the weights of the action's
+    active tiles, and writing a value moves each of them by an equal share of the difference,
+    which is the semi-gradient step of a linear function. The pair reads back the written value
+    and states sharing tiles with it move along. The active tiles of up to cache_size states
+    are remembered between calls.
+    """
+    def __init__(self, coder, state_features, actions, cache_size=4096):
+        self.coder = coder
+        self.state_features = state_features
+        self.actions = tuple(actions)
+        self.action_index = {a: i for i, a in enumerate(self.actions)}
+        self.n_features = coder.n_features
+        self.weights = array('d', [0.0]) * (len(self.actions) * self.n_features)
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def tiles(self, state):
+        tiles = self.cache.get(state)
+        if tiles is None:
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            tiles = self.cache[state] = self.coder.tiles(self.state_features(state))
+        return tiles
+
+    def value(self, tiles, action):
+        weights = self.weights
+        offset = self.action_index[action] * self.n_features
+        return sum([weights[offset + i] for i in tiles])
+
+    def __getitem__(self, key):
+        state, action = key
+        return self.value(self.tiles(state), action)
+
+    def __setitem__(self, key, value):
+        state, action = key
+        tiles = self.tiles(state)
+        weights = self.weights
+        offset = self.action_index[action] * self.n_features
+        step = (value - self.value(tiles, action)) / len(tiles)
+        for i in tiles:
+            weights[offset + i] += step
+
+    def __len__(self):
+        return len(self.weights)
+
+    def max_value(self, state, actions):
+        if not actions:
+            return 0.0
+        tiles = self.tiles(state)
+        return max([self.value(tiles, a) for a in actions])
+
+    def best_action(self, state, actions):
+        tiles = self.tiles(state)
+        best_action = None
+        best_q = None
+        for a in actions:
+            q = self.value(tiles, a)
+            if best_q is None or q > best_q:
+                best_q = q
+                best_action = a
+        return best_action
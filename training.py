@@ -0,0 +1,129 @@
+import time
+
+import environment
+import reinforcement_learning_agent
+import simple_crawler
+from q_table import DENSE_LIMIT, make_q_table
+from trajectory import TrajectoryRecorder
+from util import RandomStream
+
+def make_environment(n_arm_states=9, n_hand_states=13):
+    """
+    Creates an environment around a headless crawler.
+    """
+    return environment.Environment(simple_crawler.CrawlerPhysics(), n_arm_states, n_hand_states)
+
+# learning agents by name, their Q-values are stored as chosen by make_q_table
+LEARNING_AGENTS = {
+    'qlearning': reinforcement_learning_agent.QLearningAgent,
+    'qlambda': reinforcement_learning_agent.WatkinsQLambdaAgent,
+    'nstep': reinforcement_learning_agent.NStepQLearningAgent,
+    'dyna': reinforcement_learning_agent.DynaQAgent,
+    'replay': reinforcement_learning_agent.ReplayQLearningAgent,
+}
+
+AGENTS = list(LEARNING_AGENTS) + ['linear', 'value-iteration']
+
+def make_agent(robot_env, agent='qlearning', dense_limit=DENSE_LIMIT, q_values=None, **kwargs):
+    """
+    Creates an agent by name (see AGENTS) for the environment, learning agents get a Q-table
+    sized for it, dense unless it would exceed dense_limit entries, or learn into q_values if
+    given. The linear agent keeps a tile-coded Q-function instead. Other keyword arguments are
+    passed to the agent.
+    """
+    kwargs.setdefault('actionFcn', robot_env.get_possible_action_ids)
+    if agent == 'value-iteration':
+        return reinforcement_learning_agent.ValueIterationAgent(robot_env, **kwargs)
+    if agent == 'linear':
+        return reinforcement_learning_agent.LinearQAgent(robot_env, **kwargs)
+    if q_values is None:
+        q_values = make_q_table(robot_env.get_state_shape(), robot_env.get_all_actions(), dense_limit)
+    return LEARNING_AGENTS[agent](q_values=q_values, **kwargs)
+
+def has_dense_table(agent, state_shape, dense_limit=DENSE_LIMIT):
+    """
+    Returns whether make_agent gives the named agent a DenseQTable for an environment of
+    state_shape, so that it can be checkpointed.
+    """
+    if agent not in LEARNING_AGENTS:
+        return False
+    size = len(environment.ACTIONS)
+    for n in state_shape:
+        size *= n
+    return size <= dense_limit
+
+def step(agent, robot_env):
+    """
+    Performs a step the same way App.step does and returns its reward. Agents learn with
+    state and action IDs, see Environment.do_action_id.
+    """
+    state = robot_env.get_current_state_id()
+    action = agent.get_action(state)
+    next_state, reward = robot_env.do_action_id(action)
+    agent.observe_transition(state, action, next_state, reward)
+    return reward
+
+def train(agent, robot_env, steps, window=100, velocity_threshold=None):
+    """
+    Trains the agent for a number of steps without rendering, or until it has converged if it
+    was created with a convergence window (see ReinforcementAgent.has_converged).
+    Returns a dict with the average velocity over the last window steps, the first step at which
+    that average reached velocity_threshold (None if it never did), the step at which training
+    converged (None if it did not) and the wall time in seconds.
+    """
+    # positions of the crawler relative to where training started
+    trajectory = TrajectoryRecorder(window)
+    trajectory.reset(0.0)
+    distance = 0.0
+    threshold_step = None
+    converged_step = None
+    convergence = getattr(agent, 'convergence', None)
+    start = time.perf_counter()
+    agent.start_episode()
+    for i in range(1, steps + 1):
+        distance += step(agent, robot_env)
+        trajectory.push(distance)
+        if threshold_step is None and velocity_threshold is not None and trajectory.is_full() \
+                and trajectory.window_velocity() >= velocity_threshold:
+            threshold_step = i
+        if convergence is not None and convergence.converged():
+            converged_step = i
+            break
+    agent.end_episode()
+    return {
+        'avg_velocity': trajectory.window_velocity(),
+        'threshold_step': threshold_step,
+        'converged_step': converged_step,
+        'wall_time': time.perf_counter() - start,
+    }
+
+def train_vectorized(vec_env, q_values, steps, epsilon=0.5, alpha=0.8, gamma=0.8, window=100, seed=None):
+    """
+    Trains one dense Q-table from every crawler of a VecEnvironment at once, each step choosing
+    epsilon-greedy actions for all crawlers and applying their backups in one batch.
+    Returns the same dict as train, with the velocity averaged over the crawlers.
+    """
+    rng = RandomStream(seed)
+    legal_actions = vec_env.transitions.legal_actions
+    window = min(window, steps)
+    window_start = None
+    start = time.perf_counter()
+    for i in range(steps):
+        if i == steps - window:
+            window_start = vec_env.positions
+        states = vec_env.states
+        actions = q_values.greedy_actions(states, legal_actions)
+        for k, x in enumerate(rng.block(len(actions))):
+            if x < epsilon:
+                actions[k] = rng.choice(legal_actions[states[k]])
+        next_states, rewards = vec_env.do_actions(actions)
+        q_values.update_batch(states, actions, next_states, rewards, alpha, gamma, legal_actions)
+    if window_start is None:
+        window_start = vec_env.positions
+    distance = sum(vec_env.positions) - sum(window_start)
+    return {
+        'avg_velocity': distance / (window * vec_env.n_crawlers) if window else 0.0,
+        'threshold_step': None,
+        'converged_step': None,
+        'wall_time': time.perf_counter() - start,
+    }
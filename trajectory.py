@@ -0,0 +1,77 @@
+from array import array
+
+class TrajectoryRecorder:
+    """
+    Fixed-size ring buffer of the most recent x positions of a crawler, keeping window + 1
+    positions so the window velocity covers window steps. Pushing a position is O(1) and
+    also updates the exponential average of the per-step velocity with weight ema_weight.
+    Indexing works like the list it replaces, oldest first, so recorder[-1] is the newest.
+    """
+    def __init__(self, window=100, ema_weight=0.1):
+        if window < 1:
+            raise ValueError('Trajectory window must be at least 1 step')
+        self.window = window
+        self.capacity = window + 1
+        self.ema_weight = ema_weight
+        self.buffer = array('d', [0.0]) * self.capacity
+        self.reset()
+
+    def reset(self, *positions):
+        """
+        Forgets every position and velocity, then records the given positions.
+        """
+        self.head = 0
+        self.count = 0
+        self.ema_velocity = 0.0
+        for x in positions:
+            self.push(x)
+
+    def push(self, x):
+        buffer = self.buffer
+        head = self.head
+        if self.count:
+            self.ema_velocity += self.ema_weight * (x - buffer[head - 1] - self.ema_velocity)
+        buffer[head] = x
+        head += 1
+        self.head = 0 if head == self.capacity else head
+        if self.count < self.capacity:
+            self.count += 1
+
+    # kept for code that appends to the positions list
+    append = push
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('trajectory index out of range')
+        return self.buffer[(self.head - self.count + i) % self.capacity]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def last(self):
+        return self.buffer[self.head - 1] if self.count else 0.0
+
+    def velocity(self):
+        """
+        Returns the displacement of the last step.
+        """
+        if self.count < 2:
+            return 0.0
+        return self.buffer[self.head - 1] - self.buffer[self.head - 2]
+
+    def window_velocity(self):
+        """
+        Returns the average displacement per step over the recorded positions.
+        """
+        if self.count < 2:
+            return 0.0
+        return (self.last() - self[0]) / (self.count - 1)
+
+    def is_full(self):
+        return self.count == self.capacity
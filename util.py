@@ -1,6 +1,8 @@
+import heapq
+import itertools
 import random
-import inspect
 import sys
+from operator import itemgetter
 
 class Counter(dict):
     """
@@ -37,15 +39,71 @@ class Counter(dict):
     >>> print a['blah']
     1
 
+    Reading a missing key returns 0 without storing it, so reads never grow the counter.
+
     The counter also includes additional functionality useful in implementing
     the classifiers for this assignment.  Two counters can be added,
     subtracted or multiplied together.  See below for details.  They can
     also be normalized and their total count and arg max can be extracted.
+
+    The arg max and top keys come from a heap of (value, key) entries that is built on the
+    first query and then kept up to date by every write, so repeated queries do not scan
+    every key. Entries left behind by overwritten or deleted keys are skipped when they
+    reach the top, and the heap is rebuilt once they outnumber the keys.
     """
+    # heap of (-value, write order, key), None until the first argMax or topK
+    _heap = None
+    _order = None
+
+    def __getstate__(self):
+        # the heap is left out of pickles and copies, it is rebuilt by the next query
+        return None
+
+    def __missing__(self, key):
+        return 0
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        heap = self._heap
+        if heap is not None:
+            if len(heap) > 2 * len(self) + 16:
+                self._heap = None
+            else:
+                heapq.heappush(heap, (-value, next(self._order), key))
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._heap = None
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=0):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
 
-    def __getitem__(self, idx):
-        self.setdefault(idx, 0)
-        return dict.__getitem__(self, idx)
+    def clear(self):
+        dict.clear(self)
+        self._heap = None
+
+    def _valid_heap(self):
+        """
+        Returns the heap with a current entry on top, building it if needed.
+        """
+        heap = self._heap
+        if heap is None:
+            self._order = itertools.count()
+            heap = self._heap = [(-value, next(self._order), key) for key, value in self.items()]
+            heapq.heapify(heap)
+        while heap and not self._is_current(heap[0]):
+            heapq.heappop(heap)
+        return heap
+
+    def _is_current(self, entry):
+        key = entry[2]
+        return key in self and dict.__getitem__(self, key) == -entry[0]
 
     def incrementAll(self, keys, count):
         """
@@ -63,14 +121,36 @@ class Counter(dict):
 
     def argMax(self):
         """
-        Returns the key with the highest value.
+        Returns the key with the highest value, the earliest written of any ties.
         """
-        if len(list(self.keys())) == 0:
-            return None
-        all = list(self.items())
-        values = [x[1] for x in all]
-        maxIndex = values.index(max(values))
-        return all[maxIndex][0]
+        heap = self._valid_heap()
+        return heap[0][2] if heap else None
+
+    def topK(self, k):
+        """
+        Returns the k keys with the highest values, highest first.
+
+        >>> a = Counter()
+        >>> a['first'] = -2
+        >>> a['second'] = 4
+        >>> a['third'] = 1
+        >>> a.topK(2)
+        ['second', 'third']
+        """
+        heap = self._valid_heap()
+        entries = []
+        keys = []
+        seen = set()
+        while heap and len(keys) < k:
+            entry = heapq.heappop(heap)
+            if entry[2] in seen or not self._is_current(entry):
+                continue
+            seen.add(entry[2])
+            entries.append(entry)
+            keys.append(entry[2])
+        for entry in entries:
+            heapq.heappush(heap, entry)
+        return keys
 
     def sortedKeys(self):
         """
@@ -84,10 +164,7 @@ class Counter(dict):
         >>> a.sortedKeys()
         ['second', 'third', 'first']
         """
-        sortedItems = list(self.items())
-
-        def compare(x, y): return sign(y[1] - x[1])
-        sortedItems.sort(key=functools.cmp_to_key(compare))
+        sortedItems = sorted(self.items(), key=itemgetter(1), reverse=True)
         return [x[0] for x in sortedItems]
 
     def totalCount(self):
@@ -220,11 +297,26 @@ class Counter(dict):
         return addend
     
 
-def flip_coin(p):
-    r = random.random()
+class RandomStream(random.Random):
+    """
+    Seedable random number generator owned by one agent, so runs with the same seed repeat
+    and agents in other threads or processes share no hidden state. block draws n uniform
+    numbers at once for batched exploration and sampling.
+    """
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def block(self, n):
+        random = self.random
+        return [random() for i in range(n)]
+
+def flip_coin(p, rng=random):
+    r = rng.random()
     return r < p
 
 def raiseNotDefined():
+    # imported here since inspect is slow to import and only needed on failure
+    import inspect
     fileName = inspect.stack()[1][1]
     line = inspect.stack()[1][2]
     method = inspect.stack()[1][3]
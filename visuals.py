@@ -5,9 +5,11 @@ import sys
 import math
 from math import pi as PI
 
-import reinforcement_learning_agent
 import simple_crawler
 import environment
+import checkpoint
+import metrics
+import training
 
 class App:
     def __init__(self, win, **kwargs):
@@ -16,6 +18,8 @@ class App:
         # default gamma and alpha 0.8 (with sigmoid inverse the value is 2)
         self.ga = self.sigmoid_inv_round(kwargs['gamma']) if 'gamma' in kwargs.keys() else 2
         self.al = self.sigmoid_inv_round(kwargs['alpha']) if 'alpha' in kwargs.keys() else 2
+        # parameters given here take precedence over those of a loaded checkpoint
+        self.given_params = [name for name in ('epsilon', 'alpha', 'gamma') if name in kwargs]
         self.step_count = 0
 
         # intervals of the sigmoid inverse values
@@ -23,17 +27,74 @@ class App:
         self.inc = 0.5
         self.tick = 0.1
 
+        # turbo mode trains in time-bounded bursts of turbo_burst seconds,
+        # then sleeps turbo_yield seconds so the renderer can refresh
+        self.turbo = kwargs.pop('turbo', False)
+        self.turbo_burst = 0.05
+        self.turbo_yield = 0.01
+
+        # buckets per angle of the environment's state space
+        n_arm_states = kwargs.pop('arm_states', 9)
+        n_hand_states = kwargs.pop('hand_states', 13)
+
+        # steps covered by the average velocity readout
+        velocity_window = kwargs.pop('velocity_window', 100)
+
+        # the robot is redrawn at most fps times per second
+        self.frame_delay = max(1, int(1000 / kwargs.pop('fps', 30)))
+
+        # one of training.AGENTS, 'value-iteration' plans from the environment model
+        # while the others learn by crawling
+        agent_type = kwargs.pop('agent', 'qlearning')
+
+        # the Q-learning agent is restored from load_path, and saved to save_path
+        # every checkpoint_interval steps and on exit; in turbo mode those steps take
+        # moments, so automatic checkpoints are at least checkpoint_min_time seconds apart
+        load_path = kwargs.pop('load', None)
+        self.save_path = kwargs.pop('save', None)
+        self.checkpoint_interval = kwargs.pop('checkpoint_every', 10000)
+        self.checkpoint_min_time = 10.0
+
+        # a read-only Q-table being learned elsewhere (see hogwild), whose greedy policy
+        # the crawler follows without learning
+        watch = kwargs.pop('watch', None)
+        self.learning = watch is None
+        if watch is not None:
+            kwargs['q_values'] = watch
+
+        # per-phase timings and throughput, polled with self.metrics.snapshot()
+        # and appended to metrics_file as JSON lines if one is given
+        self.metrics = None
+        if kwargs.pop('metrics', False) or 'metrics_file' in kwargs:
+            self.metrics = metrics.StepMetrics(kwargs.pop('metrics_file', None))
+
         self.__initGUI(win)
 
-        self.robot = simple_crawler.SimpleCrawler(self.canvas)
-        self.robot_env = environment.Environment(self.robot)
+        self.robot = simple_crawler.SimpleCrawler(self.canvas, velocity_window)
+        self.robot_env = environment.Environment(self.robot, n_arm_states, n_hand_states)
+
+        actionFcn = lambda state: self.robot_env.get_possible_action_ids(state)
+        kwargs['gamma'] = self.gamma
+        self.agent = training.make_agent(self.robot_env, agent_type, actionFcn=actionFcn, **kwargs)
 
-        actionFcn = lambda state: self.robot_env.get_possible_actions(state)
-        self.agent = reinforcement_learning_agent.QLearningAgent(actionFcn=actionFcn, **kwargs)
+        if load_path or self.save_path:
+            checkpoint.check_agent(self.agent)
 
         self.agent.set_epsilon(self.epsilon)
         self.agent.set_learning_rate(self.alpha)
         self.agent.set_discount(self.gamma)
+        if not self.learning:
+            # greedy until exploration is turned up, epsilon 0 has no sigmoid inverse
+            self.epsilon = 0.0
+            self.ep = self.sigmoid_inv_round(0.002)
+            self.agent.set_epsilon(self.epsilon)
+            self.epsilon_label['text'] = 'Epsilon: %.3f' % (self.epsilon)
+
+        if load_path:
+            self.load_checkpoint(load_path)
+        self.next_checkpoint = self.step_count + self.checkpoint_interval
+        self.next_checkpoint_time = time.perf_counter() + self.checkpoint_min_time
+        self.publish()
 
         self.running = True
         self.stopped = False
@@ -47,6 +108,7 @@ class App:
         win.grid()
 
         self.setup_speed(win)
+        self.setup_turbo(win)
         self.setup_epsilon(win)
         self.setup_gamma(win)
         self.setup_alpha(win)
@@ -70,6 +132,14 @@ class App:
         text="+",command=(lambda: self.increment_speed(2)))
         self.speed_plus.grid(row=0, column=2)
 
+    def setup_turbo(self, win):
+        """
+        Sets up the turbo button, which toggles training at CPU speed.
+        """
+        self.turbo_button = tkinter.Button(win,
+        text=self.turbo_text(),command=self.toggle_turbo)
+        self.turbo_button.grid(row=0, column=6, padx=10)
+
     def setup_epsilon(self, win):
         """
         Sets up the epsilon button (explore/exploit probability).
@@ -125,6 +195,16 @@ class App:
         self.tick *= inc
         self.speed_label['text'] = 'Step Delay: %.5f' % (self.tick)
 
+    def turbo_text(self):
+        return 'Turbo: %s' % ('On' if self.turbo else 'Off')
+
+    def toggle_turbo(self):
+        """
+        Switches between the step delay and turbo training.
+        """
+        self.turbo = not self.turbo
+        self.turbo_button['text'] = self.turbo_text()
+
     def increment_epsilon(self, inc):
         """
         Changes epsilon value.
@@ -170,12 +250,53 @@ class App:
         """
         # if x=1, 1/0 returns error
         return self.__round_half_int(-math.log2(1 / x - 1)) if x < 1 else self.__round_half_int(-math.log2(1 / 0.998 - 1))
-    
+
+    def load_checkpoint(self, path):
+        """
+        Restores the agent and step count from a checkpoint and shows its parameters, keeping
+        those that were given to the App.
+        """
+        header = checkpoint.load_agent(self.agent, path)
+        self.step_count = header['step_count']
+
+        # parameters of 0 have no sigmoid inverse, start the buttons from the closest value
+        if 'epsilon' in self.given_params:
+            self.agent.set_epsilon(self.epsilon)
+        else:
+            self.epsilon = self.agent.epsilon
+            self.ep = self.sigmoid_inv_round(max(self.epsilon, 0.002))
+            self.epsilon_label['text'] = 'Epsilon: %.3f' % (self.epsilon)
+        if 'alpha' in self.given_params:
+            self.agent.set_learning_rate(self.alpha)
+        else:
+            self.alpha = self.agent.alpha
+            self.al = self.sigmoid_inv_round(max(self.alpha, 0.002))
+            self.alpha_label['text'] = 'Learning Rate: %.3f' % (self.alpha)
+        if 'gamma' in self.given_params:
+            self.agent.set_discount(self.gamma)
+        else:
+            self.gamma = self.agent.discount
+            self.ga = self.sigmoid_inv_round(max(self.gamma, 0.002))
+            self.gamma_label['text'] = 'Discount: %.3f' % (self.gamma)
+
+    def save_checkpoint(self):
+        """
+        Saves the agent to save_path, if one was given.
+        """
+        if self.save_path:
+            checkpoint.save_agent(self.agent, self.save_path, self.step_count)
+        self.next_checkpoint = self.step_count + self.checkpoint_interval
+        self.next_checkpoint_time = time.perf_counter() + self.checkpoint_min_time
+
     def exit(self):
         self.running = False
         for i in range(5):
             if not self.stopped:
                 time.sleep(0.1)
+        if self.stopped:
+            self.save_checkpoint()
+        if self.metrics is not None:
+            self.metrics.close()
         try:
             self.win.destroy()
         except:
@@ -188,27 +309,96 @@ class App:
         """
         self.step_count += 1
 
-        state = self.robot_env.get_current_state()
-        actions = self.robot_env.get_possible_actions(state)
+        # the agent learns with state and action IDs, see Environment.do_action_id
+        state = self.robot_env.get_current_state_id()
+        actions = self.robot_env.get_possible_action_ids(state)
         if len(actions) == 0.0:
             # should never reach here
             self.robot_env.reset()
-            state = self.robot_env.get_current_state()
-            actions = self.robot_env.get_possible_actions(state)
+            state = self.robot_env.get_current_state_id()
+            actions = self.robot_env.get_possible_action_ids(state)
             print('Reset!')
+        if self.metrics is not None:
+            self.timed_step(state)
+            return
         action = self.agent.get_action(state)
         if action == None:
             raise Exception('None action returned: Code Not Complete')
-        nextState, reward = self.robot_env.do_action(action)
-        self.agent.observe_transition(state, action, nextState, reward)
+        nextState, reward = self.robot_env.do_action_id(action)
+        if self.learning:
+            self.agent.observe_transition(state, action, nextState, reward)
+
+    def timed_step(self, state):
+        """
+        Performs the rest of a step like step, recording the time of each phase in the metrics.
+        """
+        t0 = time.perf_counter()
+        action = self.agent.get_action(state)
+        if action == None:
+            raise Exception('None action returned: Code Not Complete')
+        t1 = time.perf_counter()
+        nextState, reward = self.robot_env.do_action_id(action)
+        t2 = time.perf_counter()
+        if self.learning:
+            self.agent.observe_transition(state, action, nextState, reward)
+        t3 = time.perf_counter()
+        self.metrics.add_step(t1 - t0, t2 - t1, t3 - t2, reward)
+
+    def sleep(self, seconds):
+        if self.metrics is None:
+            time.sleep(seconds)
+            return
+        start = time.perf_counter()
+        time.sleep(seconds)
+        self.metrics.add('sleep', time.perf_counter() - start)
+
+    def draw(self):
+        """
+        Draws the last published snapshot of the robot, recording the render time in the metrics.
+        """
+        if self.metrics is None:
+            self.robot.draw_snapshot(self.snapshot)
+            return
+        start = time.perf_counter()
+        self.robot.draw_snapshot(self.snapshot)
+        self.metrics.add('render', time.perf_counter() - start)
+
+    def run_burst(self):
+        """
+        Performs steps until turbo_burst seconds have passed.
+        """
+        deadline = time.perf_counter() + self.turbo_burst
+        while time.perf_counter() < deadline:
+            for i in range(100):
+                self.step()
+            self.publish()
+
+    def publish(self):
+        """
+        Replaces the snapshot drawn by the Tk thread. Snapshots are immutable and the
+        assignment is atomic, so the renderer never sees a half-updated robot.
+        """
+        self.snapshot = self.robot.snapshot(self.step_count)
 
     def run(self):
-        self.step_count = 0
         self.agent.start_episode()
         while True:
+            if self.step_count >= self.next_checkpoint and time.perf_counter() >= self.next_checkpoint_time:
+                self.save_checkpoint()
+            if self.metrics is not None:
+                self.metrics.log()
+
+            if self.turbo:
+                if not self.running:
+                    self.stopped = True
+                    break
+                self.run_burst()
+                self.sleep(self.turbo_yield)
+                continue
+
             min_sleep = 0.01
             tm = max(min_sleep, self.tick)
-            time.sleep(tm)
+            self.sleep(tm)
             self.steps_to_skip = int(tm / self.tick) - 1
 
             if not self.running:
@@ -218,6 +408,7 @@ class App:
                 self.step()
             self.steps_to_skip = 0
             self.step()
+            self.publish()
         self.agent.end_episode()
 
     def start(self):
@@ -231,8 +422,8 @@ def run(**kwargs):
 
     app = App(window, **kwargs)
     def update_gui():
-        app.robot.draw(app.step_count, app.tick)
-        window.after(10, update_gui)
+        app.draw()
+        window.after(app.frame_delay, update_gui)
     update_gui()
 
     window.protocol('WM_DELETE_WINDOW', app.exit)